@@ -0,0 +1,111 @@
+"""
+Benchmark: per-page CPU time and allocations of HTML cleaning.
+
+Compares the previous two-pass path (BeautifulSoup/lxml prettify in the item
+processor, then html.parser + decompose + prettify in StoreHTMLPipeline)
+with the single-pass ``clean_html`` stage.
+
+Usage:
+    python benchmarks/bench_html_cleaning.py                  # synthetic product page
+    python benchmarks/bench_html_cleaning.py html_storage/www.grainger.com --limit 200
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vendor_scraper.utils.html_cleaner import clean_html  # noqa: E402
+
+
+def two_pass_clean(html):
+    """Cleaning path used before the single-pass stage (items.prettify_html + pipeline)."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "lxml")
+    prettified = " ".join(soup.prettify().split())
+    soup = BeautifulSoup(prettified, "html.parser")
+    for tag in soup(["video", "script", "iframe"]):
+        tag.decompose()
+    return soup.prettify()
+
+
+def synthetic_page(rows=400):
+    """Build a product page shaped like the vendor pages we store."""
+    specs = "".join(
+        f"<div><dt>Spec {i}</dt>\n    <dd>Value &amp; unit {i}</dd></div>\n" for i in range(rows)
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>Product</title>"
+        "<script>window.dataLayer = [{'a': '<div>'}];</script></head><body>"
+        '<div data-testid="pdp-header"><h1>  DEWALT Oscillating Tool Kit  </h1>'
+        f'<dl>{specs}</dl></div>'
+        '<video controls><source src="demo.mp4"></video>'
+        '<iframe src="https://ads.example.com/frame"></iframe>'
+        "<script src=\"app.js\"></script></body></html>"
+    )
+
+
+def load_pages(path, limit):
+    if not path:
+        return [synthetic_page()]
+    pages = []
+    for root, _, files in os.walk(path):
+        for name in files:
+            if name.endswith(".html"):
+                with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+                    pages.append(f.read())
+                if len(pages) >= limit:
+                    return pages
+    return pages
+
+
+def measure(func, pages, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        for page in pages:
+            func(page)
+    cpu = (time.process_time() - start) / (repeat * len(pages))
+
+    tracemalloc.start()
+    for page in pages:
+        func(page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path", nargs="?", help="Folder of stored .html pages (default: synthetic page)")
+    parser.add_argument("--limit", type=int, default=100, help="Max pages to load from path")
+    parser.add_argument("--repeat", type=int, default=20, help="Timing repetitions")
+    args = parser.parse_args()
+
+    pages = load_pages(args.path, args.limit)
+    if not pages:
+        sys.exit(f"No .html pages found in {args.path}")
+
+    total_kb = sum(len(p) for p in pages) / 1024
+    print(f"{len(pages)} page(s), {total_kb:.1f} KiB total, {args.repeat} repetitions\n")
+    print(f"{'path':<12}{'cpu ms/page':>14}{'peak alloc KiB':>18}")
+
+    results = {"single-pass": measure(clean_html, pages, args.repeat)}
+    try:
+        results["two-pass"] = measure(two_pass_clean, pages, args.repeat)
+    except ImportError:
+        print("(bs4/lxml not installed: two-pass baseline skipped)")
+
+    for name, (cpu, peak) in results.items():
+        print(f"{name:<12}{cpu * 1000:>14.3f}{peak / 1024:>18.1f}")
+
+    if "two-pass" in results:
+        speedup = results["two-pass"][0] / results["single-pass"][0]
+        print(f"\nsingle-pass is {speedup:.1f}x faster per page")
+
+
+if __name__ == "__main__":
+    main()
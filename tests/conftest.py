@@ -0,0 +1,24 @@
+import fakeredis
+import pytest
+import scrapy_redis.connection
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_client(redis_server):
+    return fakeredis.FakeRedis(server=redis_server, decode_responses=True)
+
+
+@pytest.fixture
+def scrapy_redis_server(redis_server, monkeypatch):
+    """Point scrapy-redis spiders at the fake server."""
+    def from_settings(settings):
+        return fakeredis.FakeRedis(server=redis_server)
+
+    monkeypatch.setattr(scrapy_redis.connection, "from_settings", from_settings)
+    monkeypatch.setattr(scrapy_redis.connection, "get_redis_from_settings", from_settings)
+    return redis_server
@@ -0,0 +1,21 @@
+from vendor_scraper.dataflow.load import add_url_to_pool
+from vendor_scraper.utils.domain_queues import DOMAIN_RING_KEY, domain_queue_key
+
+URLS = [f"https://www.grainger.com/product/{i}" for i in range(100)]
+
+
+def test_parallel_seeding_counts_each_url_once(tmp_path, redis_client, monkeypatch):
+    # Every batch overlaps the others, and four workers push them concurrently
+    path = tmp_path / "urls.txt"
+    path.write_text("\n".join(URLS * 4) + "\n")
+    monkeypatch.setattr(
+        add_url_to_pool, "get_redis_client", lambda max_connections=None: redis_client
+    )
+
+    stats = add_url_to_pool.seed_urls(str(path), batch_size=50, workers=4)
+
+    assert stats["valid"] == 400
+    assert stats["added"] == 100
+    assert stats["duplicates"] == 300
+    assert redis_client.smembers(DOMAIN_RING_KEY) == {"www.grainger.com"}
+    assert sorted(redis_client.lrange(domain_queue_key("www.grainger.com"), 0, -1)) == sorted(URLS)
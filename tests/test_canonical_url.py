@@ -0,0 +1,19 @@
+import json
+
+from vendor_scraper.utils.canonical_url import UrlCanonicalizer
+
+
+def test_session_params_are_only_stripped_where_configured(tmp_path):
+    path = tmp_path / "DOM_site.json"
+    path.write_text(json.dumps({"website": [
+        {"domain": "shop.example.com", "canonical": {"strip_params": ["ref", "sid", "sessionid"]}},
+    ]}))
+    canonicalizer = UrlCanonicalizer.from_config(str(path))
+
+    assert canonicalizer.canonicalize(
+        "https://shop.example.com/item?id=1&sid=abc&ref=nav&utm_source=x"
+    ) == "https://shop.example.com/item?id=1"
+    # Elsewhere these names may select content, so they are kept
+    assert canonicalizer.canonicalize(
+        "https://forum.example.org/view?ref=42&sid=7&utm_source=x"
+    ) == "https://forum.example.org/view?ref=42&sid=7"
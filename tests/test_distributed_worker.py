@@ -0,0 +1,72 @@
+import importlib.util
+import os
+from types import SimpleNamespace
+
+import pytest
+from scrapy.utils.test import get_crawler
+
+from vendor_scraper.utils.domain_queues import DOMAIN_RING_KEY, domain_of, domain_queue_key
+from vendor_scraper.utils.fetch_router import BROWSER, HTTP
+
+SPIDER_PATH = os.path.join(
+    os.path.dirname(__file__), os.pardir, "vendor_scraper", "spiders", "distributed-worker.py"
+)
+BROWSER_URL = "https://www.amazon.com/dp/B0DGB739TC"
+HTTP_URL = "https://www.grainger.com/product/55KE58"
+
+
+def load_spider_class():
+    spec = importlib.util.spec_from_file_location("distributed_worker", SPIDER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.VendorSpider
+
+
+@pytest.fixture
+def spider(scrapy_redis_server, redis_client):
+    crawler = get_crawler(load_spider_class(), {
+        "FETCH_ROUTER_ENABLED": True,
+        "CONCURRENT_REQUESTS": 16,
+        "CONCURRENT_REQUESTS_PER_DOMAIN": 8,
+    })
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(slots={}))
+    spider = crawler.spidercls.from_crawler(crawler)
+    spider.router.route = lambda domain, site=None: BROWSER if "amazon" in domain else HTTP
+    for url in (BROWSER_URL, HTTP_URL):
+        redis_client.lpush(domain_queue_key(domain_of(url)), url)
+        redis_client.sadd(DOMAIN_RING_KEY, domain_of(url))
+    return spider
+
+
+def entries(spider):
+    return sorted((domain, data.decode()) for domain, data in spider.unstarted.values())
+
+
+def queued(redis_client):
+    return [
+        url for domain in ("www.amazon.com", "www.grainger.com")
+        for url in redis_client.lrange(domain_queue_key(domain), 0, -1)
+    ]
+
+
+def test_escalated_urls_skip_http(spider, redis_client):
+    spider.router.escalate = lambda urls: len(list(urls))
+    requests = list(spider.next_requests())
+
+    assert [r.url for r in requests] == [HTTP_URL]
+    assert entries(spider) == [("www.grainger.com", HTTP_URL)]
+    assert queued(redis_client) == []
+
+
+def test_failed_escalation_falls_back_to_http(spider, redis_client):
+    spider.router.escalate = lambda urls: 0
+    requests = list(spider.next_requests())
+
+    # Every popped URL is either downloaded over HTTP or can be returned to its list
+    assert queued(redis_client) == []
+    assert sorted(r.url for r in requests) == sorted([BROWSER_URL, HTTP_URL])
+    returned = {request.meta["queue_token"] for request in requests}
+    assert set(spider.unstarted) == returned
+    assert entries(spider) == [
+        ("www.amazon.com", BROWSER_URL), ("www.grainger.com", HTTP_URL),
+    ]
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from vendor_scraper.dataflow.load.add_url_to_pool import process_batch
+from vendor_scraper.dataflow.load.url_dedupe import (
+    RedisBloomDeduper, RedisSetDeduper, bootstrap_from_queue,
+)
+from vendor_scraper.utils.domain_queues import DOMAIN_RING_KEY, domain_queue_key
+
+REDIS_KEY = "url_pools:start_urls"
+URLS = [f"https://www.grainger.com/product/{i}" for i in range(100)]
+
+
+@pytest.fixture(params=["set", "bloom_module", "bloom_bitmap"])
+def deduper(request, redis_client, monkeypatch):
+    if request.param == "set":
+        return RedisSetDeduper(redis_client)
+    if request.param == "bloom_bitmap":
+        monkeypatch.setattr(RedisBloomDeduper, "_has_bloom_module", lambda self: False)
+    return RedisBloomDeduper(redis_client, capacity=10_000, error_rate=0.001)
+
+
+def test_push_new_returns_only_new_urls(deduper, redis_client):
+    assert deduper.push_new(URLS[:60], lambda url: REDIS_KEY) == URLS[:60]
+    assert deduper.push_new(URLS, lambda url: REDIS_KEY) == URLS[60:]
+    assert sorted(redis_client.lrange(REDIS_KEY, 0, -1)) == sorted(URLS)
+
+
+def test_concurrent_overlapping_batches_queue_each_url_once(deduper, redis_client):
+    # Four identical batches racing each other: every URL is queued exactly once
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        added = list(pool.map(
+            lambda _: process_batch(redis_client, REDIS_KEY, URLS, deduper), range(4)
+        ))
+
+    queued = redis_client.lrange(domain_queue_key("www.grainger.com"), 0, -1)
+    assert sorted(queued) == sorted(URLS)
+    assert sum(added) == len(URLS)
+    assert redis_client.smembers(DOMAIN_RING_KEY) == {"www.grainger.com"}
+
+
+def test_single_layout_uses_legacy_key(deduper, redis_client):
+    assert process_batch(redis_client, REDIS_KEY, URLS + URLS[:10], deduper, sharded=False) == 100
+    assert redis_client.llen(REDIS_KEY) == 100
+    assert not redis_client.exists(DOMAIN_RING_KEY)
+
+
+def test_bootstrap_seeds_fresh_index_from_queue(deduper, redis_client):
+    # Creating a deduper must not create its key, or the first run would skip the bootstrap
+    assert deduper.is_empty()
+    redis_client.lpush(REDIS_KEY, *URLS[:10])
+
+    assert bootstrap_from_queue(deduper, redis_client, REDIS_KEY) == 10
+    assert deduper.push_new(URLS[:20], lambda url: REDIS_KEY) == URLS[10:20]
+    assert bootstrap_from_queue(deduper, redis_client, REDIS_KEY) == 0
+
+
+def test_bootstrap_reads_domain_ring_lists(deduper, redis_client):
+    other = "https://www.amazon.com/dp/B0DGB739TC"
+    redis_client.lpush(REDIS_KEY, URLS[0])
+    redis_client.lpush(domain_queue_key("www.grainger.com"), *URLS[1:5])
+    redis_client.lpush(domain_queue_key("www.amazon.com"), other)
+    redis_client.sadd(DOMAIN_RING_KEY, "www.grainger.com", "www.amazon.com")
+
+    assert bootstrap_from_queue(deduper, redis_client, REDIS_KEY) == 6
+    assert process_batch(redis_client, REDIS_KEY, URLS[:10] + [other], deduper) == 5
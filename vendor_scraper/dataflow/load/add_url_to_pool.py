@@ -1,12 +1,37 @@
 """
 Module: add_url_to_pool
-Description: Đọc danh sách URL từ file CSV và thêm vào Redis List (queue start_urls).
+Description: Đọc danh sách URL từ file (CSV/text, có thể nén gzip/zstd) và thêm vào
+Redis List (queue start_urls). File được đọc dạng stream, các batch được gửi song song
+qua nhiều kết nối Redis, cuối cùng in tốc độ (URLs/s) và tỉ lệ trùng.
+
+Mặc định URL được đẩy vào queue theo domain (`url_pools:<domain>:start_urls`, xem
+utils/domain_queues.py); `--layout single` giữ kiểu cũ 1 List `url_pools:start_urls`.
+
+Usage:
+    add_url_to_pool [file] [--workers 8] [--batch-size 10000] [--dedupe set|bloom] [--recrawl]
+                    [--layout sharded|single]
 """
 
+import io
 import os
+import csv
+import gzip
+import time
 import redis
 import logging
+import argparse
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from vendor_scraper.dataflow.load.url_dedupe import get_deduper, bootstrap_from_queue
+from vendor_scraper.utils.canonical_url import UrlCanonicalizer
+from vendor_scraper.utils.domain_queues import DOMAIN_RING_KEY, domain_of, domain_queue_key
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Load environment variables
 load_dotenv()
@@ -17,69 +42,204 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
+DEFAULT_FILE = "vendor_scraper/configs/urls_pool.csv"
+REDIS_KEY = "url_pools:start_urls"
 
-def get_redis_client():
+
+def get_redis_client(max_connections=None):
     """Tạo Redis client từ URL trong .env"""
     redis_url = os.getenv("REDIS_URL")
     if not redis_url:
         raise ValueError("REDIS_URL is not set in .env")
-    return redis.from_url(redis_url, decode_responses=True)
-
-
-def process_batch(redis_client, redis_key, urls):
-    """Thêm 1 batch URL vào Redis, loại trừ trùng lặp."""
-    urls = list(set(urls))  # Loại bỏ trùng lặp trong batch
-    logging.info(f"Processing batch with {len(urls)} unique URLs")
-
-    with redis_client.pipeline() as pipe:
-        existing_urls = set(pipe.lrange(redis_key, 0, -1))
-        urls_to_add = [url for url in urls if url not in existing_urls]
-
-        if not urls_to_add:
-            logging.info("No new URLs to add in this batch.")
-            return
-
-        # Chia nhỏ để tránh quá tải Redis
-        chunk_size = 1000
-        for i in range(0, len(urls_to_add), chunk_size):
-            chunk = urls_to_add[i:i + chunk_size]
-            pipe.lpush(redis_key, *chunk)
-            pipe.execute()
-            logging.info(f"Added {len(chunk)} URLs to Redis List ({redis_key})")
-
-        # Log các URL bị skip
-        skipped = [u for u in urls if u in existing_urls]
-        if skipped:
-            logging.info(f"{len(skipped)} URLs already exist and were skipped.")
-
-
-def add_url_to_pool(file_path="vendor_scraper/configs/urls_pool.csv", batch_size=10000):
-    """Đọc URL từ CSV và thêm vào Redis List theo batch."""
+    return redis.from_url(redis_url, decode_responses=True, max_connections=max_connections)
+
+
+def open_input(file_path):
+    """Mở file đầu vào dạng text stream, tự nhận gzip (.gz) và zstd (.zst/.zstd) theo đuôi file."""
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, "rt", encoding="utf-8", newline="")
+    if file_path.endswith((".zst", ".zstd")):
+        if zstandard is None:
+            raise ImportError("zstandard is required to read .zst files (pip install zstandard)")
+        raw = open(file_path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8", newline="")
+    return open(file_path, "r", encoding="utf-8", newline="")
+
+
+def normalize_url(value, canonicalizer=None):
+    """Chuẩn hoá 1 giá trị URL đầu vào thành URL hợp lệ (dạng canonical), trả về None nếu không hợp lệ."""
+    url = value.strip().strip('"').strip("'").strip()
+    if not url:
+        return None
     try:
-        redis_client = get_redis_client()
-        redis_key = "url_pools:start_urls"
-
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"{file_path} not found")
-
-        new_urls = []
-        with open(file_path, "r", encoding="utf-8") as file:
-            for line in file:
-                url = line.strip()
-                if url:
-                    new_urls.append(url)
-                if len(new_urls) >= batch_size:
-                    process_batch(redis_client, redis_key, new_urls)
-                    new_urls = []
-
-        if new_urls:
-            process_batch(redis_client, redis_key, new_urls)
-
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    if parts.scheme not in ("http", "https") or not parts.netloc or " " in url:
+        return None
+    return canonicalizer.canonicalize(url) if canonicalizer else url
+
+
+def iter_values(file, is_csv):
+    """URL thô của từng dòng: file CSV đọc bằng module csv (cột "url" nếu có header, không thì
+    cột đầu tiên; URL có dấu phẩy phải nằm trong dấu nháy), file text lấy nguyên dòng."""
+    if not is_csv:
+        for line in file:
+            if line.strip():
+                yield line
+        return
+    column = 0
+    for i, row in enumerate(csv.reader(file)):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if i == 0:
+            header = [cell.strip().lower() for cell in row]
+            if "url" in header:
+                column = header.index("url")
+                continue
+        yield row[column] if column < len(row) else ""
+
+
+def iter_batches(file_path, batch_size, stats, canonicalizer=None):
+    """Đọc file dạng stream, trả về từng batch URL hợp lệ (bộ nhớ chỉ giữ 1 batch)."""
+    batch = []
+    is_csv = ".csv" in os.path.basename(file_path).lower()
+    with open_input(file_path) as file:
+        for value in iter_values(file, is_csv):
+            stats["read"] += 1
+            url = normalize_url(value, canonicalizer)
+            if url is None:
+                stats["invalid"] += 1
+                continue
+            batch.append(url)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def process_batch(redis_client, redis_key, urls, deduper, sharded=True):
+    """Thêm 1 batch URL vào Redis, loại trừ trùng lặp qua deduper (không đọc lại queue).
+
+    Kiểm tra, đánh dấu "đã thấy" và LPUSH là một bước nguyên tử (deduper.push_new): các batch
+    chạy song song có URL chung không đẩy trùng, và số URL trả về là số thực sự vào queue.
+    """
+    if sharded:
+        domains = {domain_of(url) for url in urls}
+        if domains:
+            # Ghi domain vào ring trước: consumer thấy domain ngay khi List có URL
+            redis_client.sadd(DOMAIN_RING_KEY, *domains)
+
+        def queue_key(url):
+            return domain_queue_key(domain_of(url))
+    else:
+        def queue_key(url):
+            return redis_key
+
+    added = deduper.push_new(urls, queue_key, chunk_size=1000)
+    logging.debug(f"Processing batch with {len(urls)} URLs, {len(added)} new")
+    return len(added)
+
+
+def seed_urls(file_path=DEFAULT_FILE, batch_size=10000, workers=4, dedupe="set", recrawl=False, layout="sharded"):
+    """Nạp URL song song: các batch chạy trên `workers` thread, mỗi thread dùng kết nối Redis riêng.
+
+    Trả về dict thống kê: read, invalid, valid, added, duplicates, seconds.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"{file_path} not found")
+
+    redis_client = get_redis_client(max_connections=workers + 1)
+    deduper = get_deduper(redis_client, dedupe)
+    if recrawl:
+        deduper.reset()
+    bootstrap_from_queue(deduper, redis_client, REDIS_KEY)
+
+    stats = {"read": 0, "invalid": 0, "valid": 0, "added": 0}
+    lock = threading.Lock()
+    # Giới hạn số batch đang chờ để bộ nhớ không phụ thuộc kích thước file
+    in_flight = threading.BoundedSemaphore(workers * 2)
+    start = time.monotonic()
+    last_report = start
+
+    def run(batch):
+        try:
+            added = process_batch(redis_client, REDIS_KEY, batch, deduper, layout == "sharded")
+            with lock:
+                stats["valid"] += len(batch)
+                stats["added"] += added
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="seed") as pool:
+        futures = []
+        canonicalizer = UrlCanonicalizer.from_config()
+        for batch in iter_batches(file_path, batch_size, stats, canonicalizer):
+            in_flight.acquire()
+            futures.append(pool.submit(run, batch))
+            pending = []
+            for future in futures:
+                if future.done():
+                    future.result()  # Báo lỗi sớm nếu batch thất bại
+                else:
+                    pending.append(future)
+            futures = pending
+
+            now = time.monotonic()
+            if now - last_report >= 10:
+                last_report = now
+                logging.info(
+                    f"Progress: {stats['read']} read, {stats['added']} added, "
+                    f"{stats['read'] / (now - start):,.0f} URLs/s"
+                )
+        for future in futures:
+            future.result()
+
+    stats["seconds"] = time.monotonic() - start
+    stats["duplicates"] = stats["valid"] - stats["added"]
+    return stats
+
+
+def print_report(stats):
+    seconds = max(stats["seconds"], 1e-9)
+    dedupe_ratio = stats["duplicates"] / stats["valid"] if stats["valid"] else 0.0
+    print(
+        f"Seeded {stats['added']:,} new URLs into Redis in {stats['seconds']:.1f}s\n"
+        f"  read:        {stats['read']:,} lines ({stats['read'] / seconds:,.0f} URLs/s)\n"
+        f"  invalid:     {stats['invalid']:,}\n"
+        f"  duplicates:  {stats['duplicates']:,} (dedupe ratio {dedupe_ratio:.1%})"
+    )
+
+
+def add_url_to_pool(
+    file_path=DEFAULT_FILE, batch_size=10000, dedupe="set", recrawl=False, workers=4, layout="sharded"
+):
+    """Đọc URL từ file và thêm vào Redis List theo batch."""
+    try:
+        stats = seed_urls(file_path, batch_size, workers, dedupe, recrawl, layout)
+        print_report(stats)
         logging.info("All new URLs added to Redis List successfully!")
-
+        return stats
     except Exception as e:
         logging.error(f"Error adding URLs to pool: {e}", exc_info=True)
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Seed crawl URLs into the Redis queue.")
+    parser.add_argument("file", nargs="?", default=DEFAULT_FILE, help="URL file (.csv/.txt, optionally .gz or .zst)")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent Redis connections")
+    parser.add_argument("--dedupe", choices=["set", "bloom"], default="set")
+    parser.add_argument("--recrawl", action="store_true", help="Clear the dedupe index first")
+    parser.add_argument(
+        "--layout", choices=["sharded", "single"], default="sharded",
+        help="Per-domain queues (default) or the single legacy list",
+    )
+    args = parser.parse_args()
+    add_url_to_pool(args.file, args.batch_size, args.dedupe, args.recrawl, args.workers, args.layout)
+
+
 if __name__ == "__main__":
-    add_url_to_pool()
+    main()
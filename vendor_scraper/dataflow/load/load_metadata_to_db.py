@@ -1,17 +1,42 @@
 """
 Module: load_metadata_to_db
 Description: Lấy dữ liệu metadata từ Redis queue và insert vào PostgreSQL theo batch.
+
+Quy trình an toàn khi crash:
+    1. Claim: chờ bản ghi đầu tiên bằng BLMOVE (không polling), rồi gom tiếp đến khi
+       đủ BATCH_SIZE bản ghi hoặc batch đủ MAX_BATCH_AGE_MS tuổi. Bản ghi được chuyển
+       nguyên tử sang danh sách đang xử lý `scrapy:metadata:processing:<consumer>`.
+    2. Load: COPY batch vào bảng tạm rồi upsert vào `metadata_crawl_website`
+       theo khóa `url` (ON CONFLICT), commit.
+    3. Ack: xóa danh sách đang xử lý, rồi tiến checkpoint của journal backup
+       (`metadata_journal.py`, mỗi batch được ghi vào journal trước khi load).
+    Nếu tiến trình chết giữa chừng, lần chạy sau xử lý lại danh sách đang xử lý
+    trước; upsert theo url nên chạy lại không tạo bản ghi trùng.
+
+Có thể chạy nhiều consumer song song (`--consumers N`, mỗi consumer một process và
+một danh sách đang xử lý riêng). Mỗi consumer gửi heartbeat
+`scrapy:metadata:consumer:<consumer>` từ một thread nền (cả khi đang COPY hay load
+từng bản ghi lâu hơn HEARTBEAT_TTL); danh sách đang xử lý của consumer mất
+heartbeat (process chết không quay lại) được consumer khác nhận và load lại.
+
+Usage:
+    load_to_db [--consumers 4] [--batch-size 10000] [--max-age-ms 500] [--consumer-id main]
 """
 
+import io
 import os
 import sys
+import csv
 import json
 import time
-import uuid
 import redis
 import psycopg2
 import logging
+import argparse
+import threading
+import multiprocessing
 from dotenv import load_dotenv
+from vendor_scraper.dataflow.load.metadata_journal import MetadataJournal
 
 # Load env vars
 load_dotenv()
@@ -23,7 +48,21 @@ logging.basicConfig(
 )
 
 BATCH_SIZE = 10000
-CHECK_INTERVAL = 10
+MAX_BATCH_AGE_MS = 500  # Load batch chưa đầy khi bản ghi đầu tiên đã chờ lâu như vậy
+BLOCK_TIMEOUT = 1  # Giây chờ BLMOVE khi hàng đợi trống
+CHECK_INTERVAL = 10  # Giây nghỉ sau lỗi
+
+QUEUE_KEY = "scrapy:metadata"
+PROCESSING_KEY = "scrapy:metadata:processing:{consumer}"
+FAILED_KEY = "scrapy:metadata:failed"  # Bản ghi lỗi (JSON hỏng, thiếu url, sai kiểu)
+HEARTBEAT_KEY = "scrapy:metadata:consumer:{consumer}"
+HEARTBEAT_TTL = 60  # Giây; quá hạn thì danh sách đang xử lý bị coi là mồ côi
+HEARTBEAT_INTERVAL = 10  # Giây giữa hai lần gia hạn heartbeat (thread nền)
+ORPHAN_CHECK_INTERVAL = 30
+CONSUMER_ID = os.getenv("METADATA_CONSUMER_ID", "main")
+
+TABLE = "metadata_crawl_website"
+COLUMNS = ("url", "domain", "file_html", "http_status", "saved_date", "crawl_status", "fields")
 
 
 def get_redis_client():
@@ -51,74 +90,332 @@ def get_postgres_connection():
         sys.exit(1)
 
 
-def backup_metadata(batch):
-    """Backup metadata batch ra file JSON"""
-    os.makedirs("metadata", exist_ok=True)
-    date_str = time.strftime("%Y%m%d_%H%M")
-    backup_path = f"metadata/metadata_backup_{uuid.uuid4().hex}_{date_str}.json"
-    with open(backup_path, "w", encoding="utf-8") as f:
-        for record in batch:
-            json.dump(record, f, ensure_ascii=False)
-            f.write("\n")
-    return backup_path
+def ensure_url_index(cursor, conn):
+    """Tạo unique index theo url (cần cho upsert).
 
+    Nếu bảng đã có url trùng từ loader cũ, tạo index sẽ lỗi: cần dọn trùng một lần
+    (xem README) rồi chạy lại.
+    """
+    try:
+        cursor.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {TABLE}_url_key ON {TABLE} (url)"
+        )
+        conn.commit()
+    except psycopg2.errors.UniqueViolation:
+        conn.rollback()
+        logging.critical(
+            f"{TABLE} already contains duplicate urls; deduplicate it once before "
+            f"running the upsert loader (see README)."
+        )
+        sys.exit(1)
 
-def insert_metadata_to_db(cursor, conn, batch):
-    """Thực hiện batch insert vào bảng PostgreSQL"""
-    query = """
-        INSERT INTO metadata_crawl_website 
-        (url, domain, file_html, http_status, saved_date, crawl_status)
-        VALUES (%s, %s, %s, %s, %s, %s)
+
+def ensure_fields_column(cursor, conn):
+    """Thêm cột fields (JSONB, giá trị rule "fields" của DOM_site.json) nếu bảng chưa có."""
+    cursor.execute(f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS fields JSONB")
+    conn.commit()
+
+
+def create_staging_table(cursor, conn):
+    """Bảng tạm staging cho COPY (riêng mỗi kết nối, tự xóa dữ liệu khi commit)."""
+    cursor.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS metadata_staging (
+            url TEXT,
+            domain TEXT,
+            file_html TEXT,
+            http_status INTEGER,
+            saved_date TIMESTAMP,
+            crawl_status TEXT,
+            fields JSONB
+        ) ON COMMIT DELETE ROWS
+        """
+    )
+    conn.commit()
+
+
+def processing_key(consumer=CONSUMER_ID):
+    return PROCESSING_KEY.format(consumer=consumer)
+
+
+def heartbeat_key(consumer=CONSUMER_ID):
+    return HEARTBEAT_KEY.format(consumer=consumer)
+
+
+def heartbeat(redis_client, consumer=CONSUMER_ID):
+    redis_client.set(heartbeat_key(consumer), int(time.time()), ex=HEARTBEAT_TTL)
+
+
+def start_heartbeat(redis_client, consumer=CONSUMER_ID):
+    """Gia hạn heartbeat mỗi HEARTBEAT_INTERVAL giây trong thread nền (daemon).
+
+    Thread độc lập với vòng lặp load, nên một batch load lâu không làm consumer bị
+    coi là đã chết; thread dừng cùng process.
+    """
+    heartbeat(redis_client, consumer)
+
+    def beat():
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                heartbeat(redis_client, consumer)
+            except redis.RedisError as e:
+                logging.warning(f"Heartbeat of consumer {consumer} failed: {e}")
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{consumer}", daemon=True)
+    thread.start()
+    return thread
+
+
+def move_available(redis_client, key, limit):
+    """Chuyển nguyên tử tối đa limit bản ghi đang có sẵn sang key (LMOVE trong MULTI)."""
+    count = min(redis_client.llen(QUEUE_KEY), limit)
+    if count <= 0:
+        return []
+    with redis_client.pipeline(transaction=True) as pipe:
+        for _ in range(count):
+            pipe.lmove(QUEUE_KEY, key, "LEFT", "RIGHT")
+        moved = pipe.execute()
+    return [data for data in moved if data is not None]
+
+
+def claim_batch(redis_client, batch_size, max_age_ms=MAX_BATCH_AGE_MS, consumer=CONSUMER_ID):
+    """Gom một batch vào danh sách đang xử lý của consumer.
+
+    Chờ bản ghi đầu tiên tối đa BLOCK_TIMEOUT giây (BLMOVE), sau đó gom tiếp đến khi
+    đủ batch_size hoặc bản ghi đầu tiên đã chờ max_age_ms. Nếu danh sách đang xử lý
+    còn dữ liệu (lần chạy trước chết trước khi ack, hoặc vừa nhận từ consumer mồ côi),
+    trả lại chính batch đó để load lại.
+    """
+    key = processing_key(consumer)
+    pending = redis_client.lrange(key, 0, -1)
+    if pending:
+        logging.warning(f"Recovering {len(pending)} unacknowledged records from {key}")
+        return pending
+
+    first = redis_client.blmove(QUEUE_KEY, key, BLOCK_TIMEOUT, "LEFT", "RIGHT")
+    if first is None:
+        return []
+    batch = [first]
+    deadline = time.monotonic() + max_age_ms / 1000
+    while len(batch) < batch_size:
+        batch += move_available(redis_client, key, batch_size - len(batch))
+        remaining = deadline - time.monotonic()
+        # BLMOVE timeout 0 nghĩa là chờ mãi: dừng trước khi còn quá ít thời gian
+        if len(batch) >= batch_size or remaining < 0.01:
+            break
+        # Chờ thêm bản ghi cho đến hạn tuổi batch
+        data = redis_client.blmove(QUEUE_KEY, key, remaining, "LEFT", "RIGHT")
+        if data is None:
+            break
+        batch.append(data)
+    return batch
+
+
+def recover_orphans(redis_client, consumer=CONSUMER_ID):
+    """Nhận danh sách đang xử lý của một consumer đã mất heartbeat (RENAME nguyên tử).
+
+    Trả về True nếu đã nhận; batch được load lại ở lần claim_batch tiếp theo.
+    """
+    own = processing_key(consumer)
+    if redis_client.exists(own):
+        return False
+    prefix = processing_key("")
+    for key in redis_client.scan_iter(match=f"{prefix}*"):
+        other = key[len(prefix):]
+        if other == consumer or redis_client.exists(heartbeat_key(other)):
+            continue
+        try:
+            if redis_client.renamenx(key, own):
+                logging.warning(f"Took over orphaned batch of consumer {other} ({key})")
+                return True
+        except redis.ResponseError:
+            continue  # Consumer khác đã nhận trước
+    return False
+
+
+def ack_batch(redis_client, consumer=CONSUMER_ID):
+    """Batch đã commit vào PostgreSQL: bỏ danh sách đang xử lý."""
+    redis_client.delete(processing_key(consumer))
+
+
+RECORD_ERRORS = (ValueError, TypeError, OverflowError)
+
+
+def check_record(item):
+    """Kiểm tra và chuẩn hóa một bản ghi trước COPY; raise RECORD_ERRORS nếu không load được.
+
+    Cần là object JSON có url là chuỗi khác rỗng; http_status được đổi sang int
+    (rỗng thành None) để to_csv không lỗi giữa chừng.
+    """
+    if not isinstance(item, dict):
+        raise TypeError(f"expected a JSON object, got {type(item).__name__}")
+    url = item.get("url")
+    if not isinstance(url, str) or not url:
+        raise ValueError("missing url")
+    http_status = item.get("http_status")
+    item["http_status"] = None if http_status in (None, "") else int(http_status)
+    if not isinstance(item.get("fields") or {}, dict):
+        raise TypeError("fields must be a JSON object")
+    return item
+
+
+def parse_record(data):
+    return check_record(json.loads(data))
+
+
+def parse_batch(redis_client, batch_data):
+    """JSON -> dict; bản ghi lỗi được chuyển sang FAILED_KEY thay vì chặn cả batch."""
+    batch, failed = [], []
+    for data in batch_data:
+        try:
+            batch.append(parse_record(data))
+        except RECORD_ERRORS:
+            failed.append(data)
+    if failed:
+        redis_client.rpush(FAILED_KEY, *failed)
+        logging.error(f"Moved {len(failed)} malformed records to {FAILED_KEY}")
+    return batch
+
+
+def to_csv(batch):
+    """Batch (đã qua check_record) -> buffer CSV cho COPY.
+
+    Chuỗi được đặt trong dấu nháy nên "" vẫn là chuỗi rỗng; http_status,
+    saved_date và fields rỗng thành NULL nhờ FORCE_NULL.
     """
-    args = [
-        (
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for item in batch:
+        http_status = item["http_status"]
+        writer.writerow((
             item["url"],
-            item["domain"],
+            item.get("domain", ""),
             item.get("file_path", ""),
-            item["http_status"],
-            item["saved_date"],
-            item.get("crawl_status", "")
-        )
-        for item in batch
-    ]
+            "" if http_status is None else http_status,
+            item.get("saved_date") or "",
+            item.get("crawl_status", ""),
+            json.dumps(item["fields"], ensure_ascii=False) if item.get("fields") else "",
+        ))
+    buffer.seek(0)
+    return buffer
+
 
-    cursor.executemany(query, args)
+def insert_metadata_to_db(cursor, conn, batch):
+    """COPY batch vào bảng tạm rồi upsert theo url, trong một transaction.
+
+    Mỗi url chỉ giữ bản ghi mới nhất trong batch; bản ghi cũ hơn dữ liệu đã có
+    (ví dụ khi load lại batch cũ) không ghi đè.
+    """
+    columns = ", ".join(COLUMNS)
+    cursor.copy_expert(
+        f"COPY metadata_staging ({columns}) FROM STDIN WITH (FORMAT csv, FORCE_NULL (http_status, saved_date, fields))",
+        to_csv(batch),
+    )
+    cursor.execute(
+        f"""
+        INSERT INTO {TABLE} ({columns})
+        SELECT DISTINCT ON (url) {columns}
+        FROM metadata_staging
+        ORDER BY url, saved_date DESC NULLS LAST
+        ON CONFLICT (url) DO UPDATE SET
+            domain = EXCLUDED.domain,
+            file_html = EXCLUDED.file_html,
+            http_status = EXCLUDED.http_status,
+            saved_date = EXCLUDED.saved_date,
+            crawl_status = EXCLUDED.crawl_status,
+            fields = EXCLUDED.fields
+        WHERE {TABLE}.saved_date IS NULL
+            OR {TABLE}.saved_date::timestamp <= EXCLUDED.saved_date::timestamp
+        """
+    )
+    upserted = cursor.rowcount
     conn.commit()
+    return upserted
 
 
-def main():
-    redis_client = get_redis_client()
-    conn, cursor = get_postgres_connection()
+def load_batch(redis_client, cursor, conn, batch):
+    """Upsert batch; nếu có bản ghi sai kiểu dữ liệu, load từng bản ghi và
+    chuyển bản ghi lỗi sang FAILED_KEY để batch không bị kẹt mãi.
 
-    while True:
+    Bản ghi được kiểm tra lại bằng check_record (batch replay từ journal cũ chưa qua
+    parse_batch).
+    """
+    batch, failed = _checked(batch)
+    if failed:
+        redis_client.rpush(FAILED_KEY, *failed)
+        logging.error(f"Moved {len(failed)} invalid records to {FAILED_KEY}")
+    if not batch:
+        return 0
+    try:
+        return insert_metadata_to_db(cursor, conn, batch)
+    except psycopg2.DataError as e:
+        conn.rollback()
+        logging.error(f"Invalid record in batch ({e}), loading records one by one")
+    upserted, failed = 0, []
+    for item in batch:
         try:
-            queue_length = redis_client.llen("scrapy:metadata")
-            logging.info(f"Queue length: {queue_length}")
+            upserted += insert_metadata_to_db(cursor, conn, [item])
+        except psycopg2.DataError:
+            conn.rollback()
+            failed.append(json.dumps(item, ensure_ascii=False))
+    if failed:
+        redis_client.rpush(FAILED_KEY, *failed)
+        logging.error(f"Moved {len(failed)} invalid records to {FAILED_KEY}")
+    return upserted
 
-            if queue_length == 0:
-                logging.warning(f"Queue empty, waiting {CHECK_INTERVAL} seconds...")
-                time.sleep(CHECK_INTERVAL)
-                continue
 
-            batch_size = min(queue_length, BATCH_SIZE)
-            batch_data = redis_client.lrange("scrapy:metadata", 0, batch_size - 1)
-            batch = [json.loads(data) for data in batch_data]
+def _checked(batch):
+    valid, failed = [], []
+    for item in batch:
+        try:
+            valid.append(check_record(item))
+        except RECORD_ERRORS:
+            failed.append(json.dumps(item, ensure_ascii=False, default=str))
+    return valid, failed
 
-            backup_file = backup_metadata(batch)
-            logging.info(f"Backed up batch to {backup_file}")
 
-            insert_metadata_to_db(cursor, conn, batch)
-            logging.info(f"Inserted {len(batch)} records into PostgreSQL")
+def run_consumer(consumer, batch_size=BATCH_SIZE, max_age_ms=MAX_BATCH_AGE_MS):
+    """Vòng lặp load của một consumer (một process)."""
+    redis_client = get_redis_client()
+    conn, cursor = get_postgres_connection()
+    create_staging_table(cursor, conn)
+    journal = MetadataJournal(consumer)
+    start_heartbeat(redis_client, consumer)
+    logging.info(f"Consumer {consumer} started (batch {batch_size}, max age {max_age_ms} ms)")
+    orphans_checked_at = 0
+    claimed = None  # (batch, vị trí journal) đã claim nhưng chưa ack; lần thử lại dùng lại
 
-            redis_client.ltrim("scrapy:metadata", batch_size, -1)
-            logging.info(f"Removed {len(batch)} records from Redis queue")
+    while True:
+        try:
+            if time.monotonic() - orphans_checked_at >= ORPHAN_CHECK_INTERVAL:
+                orphans_checked_at = time.monotonic()
+                recover_orphans(redis_client, consumer)
 
-            # Optional cleanup backup
-            # os.remove(backup_file)
+            if claimed is None:
+                batch_data = claim_batch(redis_client, batch_size, max_age_ms, consumer)
+                if not batch_data:
+                    continue
+                batch = parse_batch(redis_client, batch_data)
+                # Ghi journal một lần cho mỗi batch, không ghi lại khi load lỗi và thử lại
+                claimed = batch, journal.append(batch)
+            batch, position = claimed
 
-            time.sleep(CHECK_INTERVAL)
+            # Trang không đổi (crawl_status = unchanged) không cần insert lại
+            changed = [item for item in batch if item.get("crawl_status") != "unchanged"]
+            upserted = load_batch(redis_client, cursor, conn, changed) if changed else 0
+
+            ack_batch(redis_client, consumer)
+            claimed = None
+            journal.commit(position)
+            logging.info(
+                f"[{consumer}] Upserted {upserted} of {len(changed)} records "
+                f"({len(batch) - len(changed)} unchanged skipped), "
+                f"{redis_client.llen(QUEUE_KEY)} left in queue"
+            )
 
         except psycopg2.Error as e:
+            # Batch vẫn nằm trong danh sách đang xử lý, sẽ được load lại
             logging.error(f"Database error: {e}")
             conn.rollback()
             time.sleep(CHECK_INTERVAL)
@@ -127,5 +424,44 @@ def main():
             time.sleep(CHECK_INTERVAL)
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Load crawl metadata from Redis into PostgreSQL.")
+    parser.add_argument("--consumers", type=int, default=1, help="Parallel consumer processes")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-age-ms", type=int, default=MAX_BATCH_AGE_MS, help="Flush a partial batch after this long")
+    parser.add_argument(
+        "--consumer-id", default=CONSUMER_ID,
+        help="Stable consumer name (suffixed -0..N-1 with --consumers > 1); reuse it after a restart",
+    )
+    args = parser.parse_args()
+
+    # Cột fields và index tạo một lần ở process cha, tránh các consumer tạo đồng thời
+    conn, cursor = get_postgres_connection()
+    ensure_fields_column(cursor, conn)
+    ensure_url_index(cursor, conn)
+    conn.close()
+
+    if args.consumers <= 1:
+        run_consumer(args.consumer_id, args.batch_size, args.max_age_ms)
+        return
+
+    processes = [
+        multiprocessing.Process(
+            target=run_consumer,
+            args=(f"{args.consumer_id}-{i}", args.batch_size, args.max_age_ms),
+            name=f"metadata-consumer-{i}",
+        )
+        for i in range(args.consumers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
 if __name__ == "__main__":
     main()
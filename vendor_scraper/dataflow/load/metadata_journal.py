@@ -0,0 +1,243 @@
+"""
+Module: metadata_journal
+Description: Nhật ký (journal) backup metadata cho load_metadata_to_db: append-only,
+nén gzip, xoay vòng theo dung lượng, có checkpoint những gì đã commit vào PostgreSQL.
+
+Bố cục (mỗi consumer một journal, không cần khóa giữa các process):
+    metadata/journal/<consumer>-00000001.jsonl.gz   segment, mỗi batch là một gzip member
+    metadata/journal/<consumer>.checkpoint.json     {"segment": n, "offset": byte} đã commit
+
+- append(batch): ghi batch thành một gzip member và flush; segment mới khi vượt
+  max_segment_mb.
+- commit(position): batch đã upsert xong thì checkpoint tiến tới cuối batch đó
+  (ghi file tạm riêng của process rồi os.replace).
+- Retention: segment đã commit hoàn toàn bị xóa khi vượt retention_segments hoặc cũ
+  hơn retention_days; segment chưa commit không bao giờ bị xóa.
+
+Replay phần chưa commit (ví dụ sau khi Redis mất dữ liệu) hoặc toàn bộ journal:
+    replay_metadata replay [--consumer main] [--from-start]
+    replay_metadata status
+Consumer còn heartbeat trong Redis (đang chạy) bị bỏ qua khi replay: chính nó đang
+load và commit journal đó.
+"""
+
+import os
+import re
+import json
+import time
+import zlib
+import logging
+import argparse
+
+JOURNAL_DIR = os.getenv("METADATA_JOURNAL_DIR", os.path.join("metadata", "journal"))
+MAX_SEGMENT_MB = 64
+RETENTION_SEGMENTS = 50  # Segment đã commit giữ lại tối đa cho mỗi consumer
+RETENTION_DAYS = 7
+
+SEGMENT_RE = re.compile(r"^(?P<consumer>.+)-(?P<seq>\d{8})\.jsonl\.gz$")
+
+
+def segment_name(consumer, seq):
+    return f"{consumer}-{seq:08d}.jsonl.gz"
+
+
+def list_segments(directory, consumer):
+    """[(seq, path)] của consumer, theo thứ tự."""
+    if not os.path.isdir(directory):
+        return []
+    segments = []
+    for name in os.listdir(directory):
+        match = SEGMENT_RE.match(name)
+        if match and match.group("consumer") == consumer:
+            segments.append((int(match.group("seq")), os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def list_consumers(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted({m.group("consumer") for m in map(SEGMENT_RE.match, os.listdir(directory)) if m})
+
+
+def iter_batches(path, offset=0):
+    """Đọc từng batch (gzip member) từ offset: yield (records, offset cuối batch).
+
+    Member cuối bị cắt dở (process chết khi đang ghi) được bỏ qua.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    position = 0
+    while position < len(data):
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            payload = decompressor.decompress(data[position:])
+        except zlib.error as e:
+            logging.error(f"Corrupt journal member in {path} at byte {offset + position}: {e}")
+            return
+        if not decompressor.eof:
+            logging.warning(f"Truncated journal member in {path} at byte {offset + position}, skipped")
+            return
+        position = len(data) - len(decompressor.unused_data)
+        records = [json.loads(line) for line in payload.decode("utf-8").splitlines() if line]
+        yield records, offset + position
+
+
+class MetadataJournal:
+    """Journal của một consumer."""
+
+    def __init__(
+        self,
+        consumer,
+        directory=JOURNAL_DIR,
+        max_segment_mb=MAX_SEGMENT_MB,
+        retention_segments=RETENTION_SEGMENTS,
+        retention_days=RETENTION_DAYS,
+    ):
+        self.consumer = consumer
+        self.directory = directory
+        self.max_segment_bytes = max_segment_mb * 2 ** 20
+        self.retention_segments = retention_segments
+        self.retention_days = retention_days
+        self.checkpoint_path = os.path.join(directory, f"{consumer}.checkpoint.json")
+        os.makedirs(directory, exist_ok=True)
+        segments = list_segments(directory, consumer)
+        # Luôn bắt đầu segment mới: không nối tiếp sau một member có thể bị cắt dở
+        self.seq = segments[-1][0] + 1 if segments else 1
+        self._file = None
+
+    # ---- ghi ----
+    def append(self, batch):
+        """Ghi batch; trả về vị trí (segment, offset) để commit sau khi load xong."""
+        if self._file is None:
+            self._file = open(os.path.join(self.directory, segment_name(self.consumer, self.seq)), "ab")
+        payload = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self._file.write(compressor.compress(payload.encode("utf-8")) + compressor.flush())
+        self._file.flush()
+        position = (self.seq, self._file.tell())
+        if position[1] >= self.max_segment_bytes:
+            self._rotate()
+        return position
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        self.seq += 1
+        self.apply_retention()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # ---- checkpoint ----
+    def read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            return checkpoint["segment"], checkpoint["offset"]
+        except (OSError, ValueError, KeyError):
+            return 0, 0
+
+    def commit(self, position):
+        """Mọi batch đến position đã nằm trong PostgreSQL."""
+        segment, offset = position
+        tmp_path = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"segment": segment, "offset": offset, "updated": time.time()}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def uncommitted(self, from_start=False):
+        """yield (records, position) của các batch sau checkpoint (hoặc toàn bộ journal)."""
+        segment, offset = (0, 0) if from_start else self.read_checkpoint()
+        for seq, path in list_segments(self.directory, self.consumer):
+            if seq < segment:
+                continue
+            start = offset if seq == segment else 0
+            for records, end in iter_batches(path, start):
+                yield records, (seq, end)
+
+    # ---- retention ----
+    def apply_retention(self):
+        """Xóa segment đã commit hoàn toàn khi vượt số lượng hoặc quá hạn."""
+        committed_segment, _ = self.read_checkpoint()
+        # Segment < checkpoint đã commit hết; segment đang ghi không bao giờ bị xóa
+        committed = [
+            (seq, path) for seq, path in list_segments(self.directory, self.consumer)
+            if seq < committed_segment and seq < self.seq
+        ]
+        cutoff = time.time() - self.retention_days * 86400
+        excess = len(committed) - self.retention_segments
+        for i, (seq, path) in enumerate(committed):
+            try:
+                if i < excess or os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    logging.info(f"Removed journal segment {path}")
+            except OSError as e:
+                logging.warning(f"Could not remove journal segment {path}: {e}")
+
+
+def replay(consumer, directory=JOURNAL_DIR, from_start=False):
+    """Load lại các batch chưa commit (hoặc toàn bộ) của consumer vào PostgreSQL."""
+    from vendor_scraper.dataflow.load import load_metadata_to_db as loader
+
+    redis_client = loader.get_redis_client()
+    if redis_client.exists(loader.heartbeat_key(consumer)):
+        logging.warning(f"Consumer {consumer} is running (heartbeat alive), journal not replayed")
+        return
+    conn, cursor = loader.get_postgres_connection()
+    loader.ensure_fields_column(cursor, conn)
+    loader.create_staging_table(cursor, conn)
+    journal = MetadataJournal(consumer, directory)
+    batches = records_total = upserted = 0
+    for records, position in journal.uncommitted(from_start):
+        changed = [item for item in records if item.get("crawl_status") != "unchanged"]
+        if changed:
+            upserted += loader.load_batch(redis_client, cursor, conn, changed)
+        if not from_start:
+            journal.commit(position)
+        batches += 1
+        records_total += len(records)
+    conn.close()
+    logging.info(
+        f"Replayed {batches} batches ({records_total} records, {upserted} upserted) "
+        f"from journal of {consumer}"
+    )
+
+
+def status(directory=JOURNAL_DIR):
+    for consumer in list_consumers(directory):
+        journal = MetadataJournal(consumer, directory)
+        segment, offset = journal.read_checkpoint()
+        segments = list_segments(directory, consumer)
+        size = sum(os.path.getsize(path) for _, path in segments)
+        pending = sum(
+            os.path.getsize(path) - (offset if seq == segment else 0)
+            for seq, path in segments if seq >= segment
+        )
+        print(
+            f"{consumer}: {len(segments)} segments, {size / 2 ** 20:.1f} MB, "
+            f"checkpoint {segment}:{offset}, {pending / 2 ** 20:.1f} MB uncommitted"
+        )
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Inspect or replay the metadata backup journal.")
+    parser.add_argument("command", choices=["replay", "status"])
+    parser.add_argument("--consumer", help="Consumer journal to replay (default: all)")
+    parser.add_argument("--directory", default=JOURNAL_DIR)
+    parser.add_argument("--from-start", action="store_true", help="Replay every retained batch, not only uncommitted ones")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        status(args.directory)
+        return
+    consumers = [args.consumer] if args.consumer else list_consumers(args.directory)
+    for consumer in consumers:
+        replay(consumer, args.directory, args.from_start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Module: url_dedupe
+Description: Loại trùng URL trước khi đẩy vào Redis queue, không cần LRANGE toàn bộ queue.
+
+- RedisSetDeduper: Redis SET chứa mọi URL đã từng được queue (chính xác tuyệt đối)
+- RedisBloomDeduper: Bloom filter (RedisBloom BF.MADD nếu server có module,
+  nếu không thì Bloom thuần Python trên Redis bitmap bằng SETBIT) - bộ nhớ cố định
+
+push_new(urls, queue_key) kiểm tra, đánh dấu và LPUSH trong cùng một bước nguyên tử:
+một Lua script cho mỗi chunk chỉ đẩy URL mà lệnh đánh dấu (SADD / BF.ADD / SETBIT) báo
+là mới, và mọi chunk của batch nằm chung một MULTI/EXEC. Hai batch chạy song song có
+cùng URL không thể cùng đẩy nó, và URL chỉ bị coi là "đã thấy" khi đã thực sự vào queue.
+Chi phí tỉ lệ với số URL đầu vào, không phụ thuộc độ dài queue.
+
+mark_seen(pipe, urls) chỉ đánh dấu (dùng khi nạp các URL đang có trong queue).
+"""
+
+import math
+import hashlib
+import logging
+import redis
+from vendor_scraper.utils.domain_queues import DOMAIN_RING_KEY, domain_queue_key
+
+# KEYS[1]: chỉ mục đã thấy, KEYS[2..]: các List queue
+# ARGV: số tham số thêm mỗi URL (k), rồi từng nhóm (vị trí List, url, k tham số thêm)
+_PUSH_NEW = """
+local k = tonumber(ARGV[1])
+local added = {}
+for i = 2, #ARGV, k + 2 do
+    local url = ARGV[i + 1]
+    local new = false
+    %s
+    if new then
+        redis.call('LPUSH', KEYS[tonumber(ARGV[i]) + 1], url)
+        added[#added + 1] = url
+    end
+end
+return added
+"""
+_MARK_SET = "new = redis.call('SADD', KEYS[1], url) == 1"
+_MARK_BF = "new = redis.call('BF.ADD', KEYS[1], url) == 1"
+_MARK_BITS = """for j = i + 2, i + k + 1 do
+        if redis.call('SETBIT', KEYS[1], ARGV[j], 1) == 0 then new = true end
+    end"""
+
+
+class _ScriptPusher:
+    """push_new chung: một Lua script mỗi chunk, các chunk chung một MULTI/EXEC."""
+
+    def _script(self):
+        raise NotImplementedError
+
+    def _extra_args(self, url):
+        return []
+
+    def push_new(self, urls, queue_key, chunk_size=1000):
+        """Đánh dấu và LPUSH vào queue_key(url) các URL chưa từng thấy; trả về các URL đã đẩy."""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return []
+        script = self._script()
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            for i in range(0, len(urls), chunk_size):
+                chunk = urls[i:i + chunk_size]
+                keys, index, args = [self.key], {}, [len(self._extra_args(chunk[0]))]
+                for url in chunk:
+                    key = queue_key(url)
+                    if key not in index:
+                        index[key] = len(keys)
+                        keys.append(key)
+                    args += [index[key], url, *self._extra_args(url)]
+                script(keys=keys, args=args, client=pipe)
+            results = pipe.execute()
+        return [
+            url.decode() if isinstance(url, bytes) else url for added in results for url in added
+        ]
+
+
+class RedisSetDeduper(_ScriptPusher):
+    """Loại trùng bằng Redis SET (SADD trả về 1 nếu URL chưa có)."""
+
+    def __init__(self, redis_client, key="url_pools:seen"):
+        self.redis_client = redis_client
+        self.key = key
+        self._push = redis_client.register_script(_PUSH_NEW % _MARK_SET)
+
+    def _script(self):
+        return self._push
+
+    def mark_seen(self, pipe, urls, chunk_size=1000):
+        """Thêm lệnh đánh dấu URL vào pipeline (caller execute)."""
+        for i in range(0, len(urls), chunk_size):
+            pipe.sadd(self.key, *urls[i:i + chunk_size])
+
+    def is_empty(self):
+        return not self.redis_client.exists(self.key)
+
+    def reset(self):
+        self.redis_client.delete(self.key)
+
+
+class RedisBloomDeduper(_ScriptPusher):
+    """Loại trùng bằng Bloom filter: bộ nhớ cố định, có thể báo nhầm "đã thấy" với xác suất error_rate."""
+
+    def __init__(self, redis_client, key="url_pools:seen_bloom", capacity=50_000_000, error_rate=0.001):
+        self.redis_client = redis_client
+        self.key = key
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # Kích thước bitmap và số hàm hash tối ưu cho (capacity, error_rate)
+        self.num_bits = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._reserved = False
+        self.use_module = self._has_bloom_module()
+        self._push = redis_client.register_script(
+            _PUSH_NEW % (_MARK_BF if self.use_module else _MARK_BITS)
+        )
+        if self.use_module:
+            logging.info(f"Using RedisBloom module for URL dedupe ({key})")
+        else:
+            logging.info(
+                f"RedisBloom not available, using Python Bloom filter on bitmap {key} "
+                f"({self.num_bits / 8 / 1024 / 1024:.0f} MiB, {self.num_hashes} hashes)"
+            )
+
+    def _has_bloom_module(self):
+        """Dò module bằng BF.EXISTS (chỉ đọc, không tạo key, để is_empty() còn đúng)."""
+        try:
+            self.redis_client.execute_command("BF.EXISTS", self.key, "")
+            return True
+        except redis.ResponseError:
+            # Không có module, hoặc key là bitmap của Bloom Python (WRONGTYPE): dùng bitmap
+            return False
+
+    def _reserve(self):
+        """Tạo Bloom của module với capacity / error_rate trước lần thêm đầu tiên."""
+        if self._reserved or not self.use_module:
+            return
+        try:
+            self.redis_client.execute_command("BF.RESERVE", self.key, self.error_rate, self.capacity)
+        except redis.ResponseError as e:
+            if "exists" not in str(e).lower():
+                raise
+        self._reserved = True
+
+    def _positions(self, url):
+        digest = hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def _script(self):
+        self._reserve()
+        return self._push
+
+    def _extra_args(self, url):
+        # Bloom Python: URL mới nếu ít nhất một bit của nó đang bằng 0
+        return [] if self.use_module else self._positions(url)
+
+    def mark_seen(self, pipe, urls, chunk_size=1000):
+        """Thêm lệnh đánh dấu URL vào pipeline (caller execute)."""
+        self._reserve()
+        if self.use_module:
+            for i in range(0, len(urls), chunk_size):
+                pipe.execute_command("BF.MADD", self.key, *urls[i:i + chunk_size])
+            return
+        for url in urls:
+            for position in self._positions(url):
+                pipe.setbit(self.key, position, 1)
+
+    def is_empty(self):
+        return not self.redis_client.exists(self.key)
+
+    def reset(self):
+        self.redis_client.delete(self.key)
+        self._reserved = False
+
+
+def get_deduper(redis_client, method="set", **options):
+    """Tạo deduper theo tên: 'set' (chính xác) hoặc 'bloom' (bộ nhớ cố định)."""
+    if method == "set":
+        return RedisSetDeduper(redis_client, **options)
+    if method == "bloom":
+        return RedisBloomDeduper(redis_client, **options)
+    raise ValueError(f"Invalid dedupe method: {method}. Must be 'set' or 'bloom'.")
+
+
+def bootstrap_from_queue(deduper, redis_client, redis_key, chunk_size=10000):
+    """Lần đầu dùng deduper: nạp các URL đang có trong queue (một lần duy nhất, theo từng chunk).
+
+    Đọc cả List cũ `redis_key` lẫn List của từng domain trong ring
+    (`url_pools:<domain>:start_urls`).
+    """
+    if not deduper.is_empty():
+        return 0
+    domains = sorted(
+        m.decode() if isinstance(m, bytes) else m for m in redis_client.smembers(DOMAIN_RING_KEY)
+    )
+    total = 0
+    for key in [redis_key, *(domain_queue_key(domain) for domain in domains)]:
+        length = redis_client.llen(key)
+        for start in range(0, length, chunk_size):
+            # Consumer có thể đang lấy bớt URL: List ngắn lại thì chunk rỗng
+            urls = redis_client.lrange(key, start, start + chunk_size - 1)
+            if not urls:
+                break
+            with redis_client.pipeline(transaction=False) as pipe:
+                deduper.mark_seen(pipe, urls)
+                pipe.execute()
+        total += length
+    if total:
+        logging.info(f"Seeded dedupe index with {total} URLs already queued")
+    return total
@@ -0,0 +1,61 @@
+"""
+Module: extractors
+Description: Bộ trích xuất dữ liệu sản phẩm theo domain từ HTML đã lưu (thay cho các
+vòng lặp BeautifulSoup trong notebook parse_html_crawl.ipynb).
+
+Các trường được khai báo trong `"fields"` của `configs/DOM_site.json` và biên dịch một
+lần thành XPath lxml (xem `utils/field_rules.py`); cùng bộ rule đó chạy trong
+`VendorSpider.parse`. Domain chưa có rule chỉ lấy URL canonical và tiêu đề.
+
+Mỗi extractor nhận một parsel Selector (lxml) của trang và trả về dict phẳng; khóa
+`columns` là thứ tự cột khi ghi CSV (cột lạ được gom vào EXTRA dạng JSON).
+"""
+
+from parsel import Selector
+from vendor_scraper.utils.field_rules import clean_text
+from vendor_scraper.utils.site_config import get_registry
+
+
+class Extractor:
+    """Trích xuất chung: URL canonical và tiêu đề trang."""
+
+    columns = ["FILE_NAME", "URL_ITEM", "DESCRIPTION"]
+
+    def page_url(self, sel):
+        return sel.xpath(
+            "string((//link[@rel='canonical']/@href | //meta[@property='og:url']/@content)[1])"
+        ).get()
+
+    def extract(self, sel):
+        return {
+            "URL_ITEM": self.page_url(sel),
+            "DESCRIPTION": clean_text(sel.xpath("string((//h1)[1])").get()),
+        }
+
+    def parse(self, html, file_name=""):
+        record = {"FILE_NAME": file_name}
+        record.update(self.extract(Selector(text=html)))
+        return record
+
+
+class RuleExtractor(Extractor):
+    """Trích xuất theo rule `"fields"` của site trong DOM_site.json."""
+
+    def __init__(self, site):
+        self.site = site
+        self.columns = ["FILE_NAME", "URL_ITEM"] + [
+            column for column in site.field_columns if column not in ("FILE_NAME", "URL_ITEM")
+        ]
+
+    def extract(self, sel):
+        record = {"URL_ITEM": self.page_url(sel)}
+        record.update(self.site.extract(sel))
+        return record
+
+
+def get_extractor(domain):
+    """Extractor theo rule của domain (tra cứu như VendorSpider), hoặc Extractor chung."""
+    site = get_registry().lookup(domain)
+    if site is not None and site.fields:
+        return RuleExtractor(site)
+    return Extractor()
@@ -0,0 +1,234 @@
+"""
+Module: run_all
+Description: Parse song song HTML đã lưu (FileSystemStorage `.html` hoặc PackStorage
+`.pack`) thành JSON-lines / CSV theo domain.
+
+- Trang được chia thành task nhỏ (`--chunk-size` trang) và parse trong pool
+  multiprocessing (`imap_unordered`), dùng hết các core.
+- Kết quả được ghi ra file ngay khi có, không giữ toàn bộ sản phẩm trong bộ nhớ;
+  số task đang chờ bị giới hạn nên bộ nhớ không tăng theo số trang.
+- Với pack, mỗi URL chỉ được parse một lần: trong một pack là bản ghi mới nhất (theo
+  file .idx); giữa các pack, pack sửa đổi gần nhất (mtime) thắng. Pack do nhiều worker
+  ghi cùng lúc chồng nhau về thời gian nên thứ tự giữa chúng chỉ là gần đúng.
+- Pack rỗng hoặc không đọc được bị bỏ qua (ghi log), không dừng cả lần chạy.
+
+Usage:
+    parse_data [--root html_storage] [--domain www.grainger.com ...] [--out-dir data]
+               [--format jsonl|csv] [--workers 8] [--chunk-size 200]
+"""
+
+import os
+import csv
+import json
+import time
+import logging
+import argparse
+import threading
+import multiprocessing
+from dotenv import load_dotenv
+from vendor_scraper.storage import PackReader
+from vendor_scraper.dataflow.parse.extractors import get_extractor
+
+# Load env vars
+load_dotenv()
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+DEFAULT_ROOT = os.getenv("HTML_STORAGE_PATH", "html_storage")
+DEFAULT_OUT_DIR = "data"
+CHUNK_SIZE = 200  # Trang mỗi task
+MAX_PENDING_PER_WORKER = 4  # Task chờ tối đa cho mỗi worker
+PROGRESS_EVERY = 10000
+
+
+# ---- liệt kê trang ----
+def iter_tasks(domain_dir, chunk_size):
+    """Task (kind, path, items): ("files", thư mục, [tên file]) hoặc ("pack", file pack, [offset])."""
+    files, packs = [], []
+    with os.scandir(domain_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".html"):
+                files.append(entry.name)
+                if len(files) >= chunk_size:
+                    yield "files", domain_dir, files
+                    files = []
+            elif entry.name.endswith(".pack"):
+                try:
+                    stat = entry.stat()
+                except OSError as e:
+                    logging.error(f"Skipping unreadable pack {entry.path}: {e}")
+                    continue
+                if stat.st_size:  # Pack vừa xoay vòng, chưa có bản ghi
+                    packs.append((stat.st_mtime, entry.path))
+    if files:
+        yield "files", domain_dir, files
+
+    # Pack mới nhất trước: URL đã gặp ở pack mới hơn thì bỏ qua ở pack cũ
+    seen = set()
+    for _, path in sorted(packs, reverse=True):
+        offsets = pack_offsets(path, seen)
+        for i in range(0, len(offsets), chunk_size):
+            yield "pack", path, offsets[i:i + chunk_size]
+
+
+def pack_offsets(path, seen):
+    """Offset (đã sắp xếp) các URL của pack chưa có trong seen; pack lỗi trả về []."""
+    try:
+        with PackReader(path) as pack:
+            index = pack.offsets
+    except (OSError, ValueError) as e:
+        logging.error(f"Skipping unreadable pack {path}: {e}")
+        return []
+    offsets = []
+    for key, offset in index.items():
+        if key not in seen:
+            seen.add(key)
+            offsets.append(offset)
+    return sorted(offsets)
+
+
+def bounded(tasks, semaphore):
+    """Pool đọc hết iterable đầu vào ngay; chặn lại để chỉ một số task nằm chờ."""
+    for task in tasks:
+        semaphore.acquire()
+        yield task
+
+
+# ---- worker ----
+def parse_task(args):
+    """Parse một task trong process worker; trả về (số trang, bản ghi, số lỗi)."""
+    domain, (kind, path, items) = args
+    try:
+        extractor = get_extractor(domain)
+        if kind == "pack":
+            with PackReader(path) as pack:
+                pages = (
+                    (f"{os.path.basename(path)}#{offset}", lambda o=offset: pack.read_at(o))
+                    for offset in items
+                )
+                records, errors = _parse_pages(extractor, pages)
+        else:
+            pages = ((name, lambda n=name: _read_file(os.path.join(path, n))) for name in items)
+            records, errors = _parse_pages(extractor, pages)
+    except Exception as e:
+        # Ví dụ pack bị xóa / không mở được giữa lúc liệt kê và lúc parse: cả task tính là lỗi
+        logging.error(f"Failed to parse {len(items)} pages from {path}: {e}")
+        return len(items), [], len(items)
+    return len(items), records, errors
+
+
+def _read_file(file_path):
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _parse_pages(extractor, pages):
+    records, errors = [], 0
+    for file_name, read in pages:
+        try:
+            records.append(extractor.parse(read(), file_name))
+        except Exception as e:
+            errors += 1
+            logging.error(f"Failed to parse {file_name}: {e}")
+    return records, errors
+
+
+# ---- ghi kết quả ----
+class JsonLinesWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class CsvWriter:
+    """Cột cố định theo extractor; khóa khác được gom vào cột EXTRA (JSON)."""
+
+    def __init__(self, path, columns):
+        self.file = open(path, "w", encoding="utf-8-sig", newline="")
+        self.columns = list(columns)
+        self.writer = csv.DictWriter(self.file, fieldnames=self.columns + ["EXTRA"])
+        self.writer.writeheader()
+
+    def write(self, record):
+        row, extra = {}, {}
+        for key, value in record.items():
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False)
+            if key in self.columns:
+                row[key] = value
+            else:
+                extra[key] = value
+        row["EXTRA"] = json.dumps(extra, ensure_ascii=False) if extra else ""
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+WRITERS = {"jsonl": JsonLinesWriter, "csv": CsvWriter}
+
+
+def parse_domain(pool, root, domain, out_dir, fmt, chunk_size, max_pending):
+    domain_dir = os.path.join(root, domain)
+    output_path = os.path.join(out_dir, f"{domain}.{fmt}")
+    writer = WRITERS[fmt](output_path, get_extractor(domain).columns)
+    semaphore = threading.Semaphore(max_pending)
+    tasks = ((domain, task) for task in bounded(iter_tasks(domain_dir, chunk_size), semaphore))
+    pages = products = errors = 0
+    next_report = PROGRESS_EVERY
+    started = time.perf_counter()
+    try:
+        for count, records, failed in pool.imap_unordered(parse_task, tasks):
+            semaphore.release()
+            for record in records:
+                writer.write(record)
+            pages += count
+            products += len(records)
+            errors += failed
+            if pages >= next_report:
+                next_report += PROGRESS_EVERY
+                rate = pages / (time.perf_counter() - started)
+                logging.info(f"{domain}: {pages} pages parsed ({rate:.0f} pages/s)")
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - started
+    logging.info(
+        f"{domain}: {products} products from {pages} pages ({errors} errors) in {elapsed:.1f}s "
+        f"-> {output_path}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse stored HTML into product records.")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="HTML storage root (<root>/<domain>/...)")
+    parser.add_argument("--domain", action="append", help="Domain folder to parse (repeatable; default: all)")
+    parser.add_argument("--out-dir", default=DEFAULT_OUT_DIR)
+    parser.add_argument("--format", choices=list(WRITERS), default="jsonl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Pages per task")
+    args = parser.parse_args()
+
+    domains = args.domain or sorted(
+        entry.name for entry in os.scandir(args.root) if entry.is_dir()
+    )
+    os.makedirs(args.out_dir, exist_ok=True)
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.workers) as pool:
+        for domain in domains:
+            parse_domain(
+                pool, args.root, domain, args.out_dir, args.format,
+                args.chunk_size, args.workers * MAX_PENDING_PER_WORKER,
+            )
+
+
+if __name__ == "__main__":
+    main()
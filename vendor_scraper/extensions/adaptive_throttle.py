@@ -0,0 +1,250 @@
+"""
+Per-domain adaptive rate control (AutoThrottle-style, one controller per downloader slot).
+
+Each domain starts at DOWNLOAD_DELAY / CONCURRENT_REQUESTS_PER_DOMAIN and keeps its own
+delay and concurrency from there:
+- latency: delay converges to ``latency / ADAPTIVE_THROTTLE_TARGET_CONCURRENCY``
+- 429 / 503: delay doubles (at least ``Retry-After``), concurrency halves
+- retries: a retry rate above ``ADAPTIVE_THROTTLE_MAX_RETRY_RATE`` backs off like a 429
+- a streak of clean responses adds one to concurrency (up to the max)
+
+A ``"crawl"`` block in DOM_site.json (DOWNLOAD_SLOTS) is the floor for that domain:
+``download_delay`` is its minimum delay and ``concurrency`` its maximum concurrency.
+
+State is shared through the Redis hash ``ADAPTIVE_THROTTLE_REDIS_KEY`` (field = domain,
+value = JSON): new workers start from the learned rate, and a back-off seen by one
+worker is adopted by the others on their next sync. ``HGETALL throttle:domains``
+shows the current per-domain rate; it is also in the crawl stats as
+``throttle/<domain>/delay`` and ``throttle/<domain>/concurrency``.
+"""
+
+import os
+import json
+import time
+import socket
+import logging
+import redis
+from twisted.internet import task
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUSES = (429, 503)
+
+
+class DomainRate:
+    """Controller state for one domain."""
+
+    def __init__(self, delay, concurrency):
+        self.delay = delay
+        self.concurrency = concurrency
+        self.latency = None  # EWMA, seconds
+        self.responses = 0
+        self.throttled = 0
+        self.retries = 0
+        self.streak = 0
+        self.backoff_at = 0.0  # Last back-off (ours or adopted from another worker)
+        self.changed = False
+
+    def to_json(self, worker):
+        return json.dumps({
+            "worker": worker,
+            "delay": round(self.delay, 3),
+            "concurrency": self.concurrency,
+            "rps": round(self.concurrency / self.delay, 2) if self.delay else None,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "responses": self.responses,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "backoff_at": self.backoff_at,
+            "updated": time.time(),
+        })
+
+
+class AdaptiveThrottle:
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.start_delay = settings.getfloat("DOWNLOAD_DELAY")
+        self.min_delay = settings.getfloat("ADAPTIVE_THROTTLE_MIN_DELAY")
+        self.max_delay = settings.getfloat("ADAPTIVE_THROTTLE_MAX_DELAY")
+        self.target_concurrency = settings.getfloat("ADAPTIVE_THROTTLE_TARGET_CONCURRENCY")
+        self.start_concurrency = settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN")
+        self.max_concurrency = settings.getint("ADAPTIVE_THROTTLE_MAX_CONCURRENCY")
+        self.max_retry_rate = settings.getfloat("ADAPTIVE_THROTTLE_MAX_RETRY_RATE")
+        self.increase_after = settings.getint("ADAPTIVE_THROTTLE_INCREASE_AFTER")
+        self.sync_interval = settings.getfloat("ADAPTIVE_THROTTLE_SYNC_INTERVAL")
+        self.state_ttl = settings.getfloat("ADAPTIVE_THROTTLE_STATE_TTL")
+        self.redis_key = settings.get("ADAPTIVE_THROTTLE_REDIS_KEY")
+        self.slot_settings = settings.getdict("DOWNLOAD_SLOTS")
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+
+        redis_url = settings.get("REDIS_URL")
+        self.redis_client = redis.from_url(redis_url, decode_responses=True) if redis_url else None
+        self.rates = {}
+        self.sync_loop = task.LoopingCall(self.sync)
+
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(self.response_downloaded, signal=signals.response_downloaded)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        self.sync()
+        if self.redis_client is not None:
+            self.sync_loop.start(self.sync_interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.sync_loop.running:
+            self.sync_loop.stop()
+        self.sync()
+
+    # ---- limits ----
+    def _floor_delay(self, domain):
+        return max(self.min_delay, self.slot_settings.get(domain, {}).get("delay", 0))
+
+    def _max_concurrency(self, domain):
+        return min(self.max_concurrency, self.slot_settings.get(domain, {}).get("concurrency", self.max_concurrency))
+
+    def _clamp(self, domain, rate):
+        rate.delay = min(max(self._floor_delay(domain), rate.delay), self.max_delay)
+        rate.concurrency = min(max(1, rate.concurrency), self._max_concurrency(domain))
+
+    def _rate(self, domain):
+        rate = self.rates.get(domain)
+        if rate is None:
+            rate = DomainRate(self.start_delay, self.start_concurrency)
+            self._clamp(domain, rate)
+            self.rates[domain] = rate
+        return rate
+
+    def _apply(self, key, rate):
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None:
+            slot.delay = rate.delay
+            slot.concurrency = rate.concurrency
+
+    # ---- signals ----
+    def request_reached_downloader(self, request, spider):
+        # Slots are created (and garbage-collected) by the downloader, so push the
+        # current rate every time a request enters one
+        key = request.meta.get("download_slot")
+        if key is None:
+            return
+        rate = self._rate(key)
+        if request.meta.get("retry_times"):
+            rate.retries += 1
+        self._apply(key, rate)
+
+    def response_downloaded(self, response, request, spider):
+        key = request.meta.get("download_slot")
+        if key is None:
+            return
+        rate = self._rate(key)
+        rate.responses += 1
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            rate.latency = latency if rate.latency is None else 0.8 * rate.latency + 0.2 * latency
+
+        if response.status in THROTTLE_STATUSES:
+            rate.throttled += 1
+            self._back_off(key, rate, self._retry_after(response))
+        elif rate.responses >= 20 and rate.retries / rate.responses > self.max_retry_rate:
+            rate.retries = 0
+            rate.responses = 0
+            self._back_off(key, rate)
+        else:
+            self._adjust(key, rate, latency, response.status)
+        self._apply(key, rate)
+
+    # ---- policy ----
+    def _back_off(self, domain, rate, retry_after=None):
+        rate.delay = max(rate.delay * 2, retry_after or 0, self.start_delay)
+        rate.concurrency = rate.concurrency // 2
+        rate.streak = 0
+        rate.backoff_at = time.time()
+        rate.changed = True
+        self._clamp(domain, rate)
+        self.stats.inc_value("throttle/backoff")
+        logger.info(f"[Throttle] {domain}: back off to delay={rate.delay:.2f}s concurrency={rate.concurrency}")
+
+    def _adjust(self, domain, rate, latency, status):
+        if latency is None:
+            return
+        old = (rate.delay, rate.concurrency)
+        target_delay = latency / self.target_concurrency
+        new_delay = max(target_delay, (rate.delay + target_delay) / 2.0)
+        # Error pages are small and fast; never let them shorten the delay
+        if status == 200 or new_delay > rate.delay:
+            rate.delay = new_delay
+        if status == 200:
+            rate.streak += 1
+            if rate.streak >= self.increase_after:
+                rate.streak = 0
+                rate.concurrency += 1
+        self._clamp(domain, rate)
+        if (rate.delay, rate.concurrency) != old:
+            rate.changed = True
+
+    @staticmethod
+    def _retry_after(response):
+        value = response.headers.get("Retry-After")
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None  # HTTP-date form: fall back to doubling
+
+    # ---- shared state ----
+    def sync(self):
+        """Publish changed domains and pick up rates / back-offs learned by other workers."""
+        if self.redis_client is None:
+            self._export_stats()
+            return
+        try:
+            remote = self.redis_client.hgetall(self.redis_key)
+            now = time.time()
+            updates = {}
+            for domain, raw in remote.items():
+                try:
+                    state = json.loads(raw)
+                except ValueError:
+                    continue
+                if now - state.get("updated", 0) > self.state_ttl:
+                    continue
+                rate = self.rates.get(domain)
+                if rate is None:
+                    # First sight of this domain on this worker: start from the shared rate
+                    rate = self._rate(domain)
+                    rate.delay = state["delay"]
+                    rate.concurrency = state["concurrency"]
+                    rate.backoff_at = state.get("backoff_at", 0)
+                    self._clamp(domain, rate)
+                elif state.get("backoff_at", 0) > rate.backoff_at:
+                    # Another worker was throttled: slow down with it
+                    rate.delay = max(rate.delay, state["delay"])
+                    rate.concurrency = min(rate.concurrency, state["concurrency"])
+                    rate.backoff_at = state["backoff_at"]
+                    self._clamp(domain, rate)
+                self._apply(domain, rate)
+            for domain, rate in self.rates.items():
+                if rate.changed:
+                    updates[domain] = rate.to_json(self.worker_id)
+                    rate.changed = False
+            if updates:
+                self.redis_client.hset(self.redis_key, mapping=updates)
+        except redis.RedisError as e:
+            logger.warning(f"[Throttle] Redis sync failed: {e}")
+        self._export_stats()
+
+    def _export_stats(self):
+        for domain, rate in self.rates.items():
+            self.stats.set_value(f"throttle/{domain}/delay", round(rate.delay, 3))
+            self.stats.set_value(f"throttle/{domain}/concurrency", rate.concurrency)
@@ -3,18 +3,7 @@ Defines Scrapy Item classes for vendor_scraper project.
 """
 
 import scrapy
-from scrapy.loader.processors import MapCompose, TakeFirst
-from bs4 import BeautifulSoup
-
-
-def prettify_html(html):
-    """Clean and prettify HTML."""
-    try:
-        soup = BeautifulSoup(html, "lxml")
-        cleaned = " ".join(soup.prettify().split())
-        return cleaned
-    except Exception:
-        return html.strip()
+from scrapy.loader.processors import Join, TakeFirst
 
 
 class ProductItem(scrapy.Item):
@@ -23,4 +12,7 @@ class ProductItem(scrapy.Item):
     domain = scrapy.Field(output_processor=TakeFirst())
     url_item = scrapy.Field(output_processor=TakeFirst())
     status_code = scrapy.Field(output_processor=TakeFirst())
-    source_page_html = scrapy.Field(input_processor=MapCompose(prettify_html))
+    # Raw selector HTML; StoreHTMLPipeline cleans it off the reactor thread
+    source_page_html = scrapy.Field(output_processor=Join(""))
+    # Values of the site's "fields" rules in DOM_site.json (dict)
+    fields = scrapy.Field(output_processor=TakeFirst())
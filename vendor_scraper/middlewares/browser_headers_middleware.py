@@ -1,15 +1,25 @@
-import requests, random, logging
+import requests, logging
 from urllib.parse import urlencode
+from vendor_scraper.utils.header_profiles import get_provider
 
 logger = logging.getLogger(__name__)
 
 class ScrapeOpsFakeBrowserHeaderAgentMiddleware:
+    """Browser headers from the ScrapeOps API, served from the shared header profile cache.
+
+    The API is only called from a background refresh once the cache is older than
+    HEADER_PROFILES_TTL; startup uses the cache (or list_user_agents.txt) as is.
+    """
+
     def __init__(self, settings):
         self.api_key = settings.get('SCRAPEOPS_API_KEY')
         self.endpoint = settings.get('SCRAPEOPS_FAKE_BROWSER_HEADER_ENDPOINT', 'http://headers.scrapeops.io/v1/browser-headers')
         self.num_results = settings.get('SCRAPEOPS_NUM_RESULTS')
-        self.headers_list = []
-        self._get_headers_list()
+        self.provider = get_provider(
+            settings.get('HEADER_PROFILES_CACHE'),
+            ttl=settings.getint('HEADER_PROFILES_TTL', 86400),
+            fetcher=self._get_headers_list if self.api_key else None,
+        )
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -19,12 +29,11 @@ class ScrapeOpsFakeBrowserHeaderAgentMiddleware:
         payload = {'api_key': self.api_key}
         if self.num_results:
             payload['num_results'] = self.num_results
-        res = requests.get(self.endpoint, params=urlencode(payload))
-        self.headers_list = res.json().get('result', [])
+        res = requests.get(self.endpoint, params=urlencode(payload), timeout=30)
+        res.raise_for_status()
+        return res.json().get('result', [])
 
     def process_request(self, request, spider):
-        if not self.headers_list:
-            return
-        header = random.choice(self.headers_list)
+        header = self.provider.random_profile()
         request.headers.update(header)
         logger.debug(f"[Browser-Headers] Applied headers for {request.url}")
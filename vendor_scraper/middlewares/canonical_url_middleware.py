@@ -0,0 +1,33 @@
+import logging
+from scrapy import Request
+from vendor_scraper.utils.canonical_url import UrlCanonicalizer
+
+logger = logging.getLogger(__name__)
+
+
+class CanonicalUrlMiddleware:
+    """Spider middleware: rewrite outgoing requests to their canonical URL before scheduling."""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.canonicalizer = UrlCanonicalizer.from_config()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.stats)
+
+    def process_start_requests(self, start_requests, spider):
+        for request in start_requests:
+            yield self._canonical(request)
+
+    def process_spider_output(self, response, result, spider):
+        for i in result:
+            yield self._canonical(i) if isinstance(i, Request) else i
+
+    def _canonical(self, request):
+        url = self.canonicalizer.canonicalize(request.url)
+        if url == request.url:
+            return request
+        self.stats.inc_value("canonical_url/rewritten")
+        logger.debug(f"[Canonical-URL] {request.url} -> {url}")
+        return request.replace(url=url)
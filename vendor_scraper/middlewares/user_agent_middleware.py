@@ -1,13 +1,22 @@
-import random
-from fake_useragent import UserAgent
 import logging
+from vendor_scraper.utils.header_profiles import get_provider
 
 logger = logging.getLogger(__name__)
 
 class RandomUserAgentMiddleware:
-    def __init__(self):
-        self.ua = UserAgent()
+    """Apply a random header profile (User-Agent with matching Accept / sec-ch-ua headers)."""
+
+    def __init__(self, settings):
+        self.provider = get_provider(
+            settings.get('HEADER_PROFILES_CACHE'),
+            ttl=settings.getint('HEADER_PROFILES_TTL', 86400),
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings)
 
     def process_request(self, request, spider):
-        request.headers['User-Agent'] = self.ua.random
+        for name, value in self.provider.random_profile().items():
+            request.headers[name] = value
         logger.debug(f"[User-Agent] {request.headers['User-Agent']}")
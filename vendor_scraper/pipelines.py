@@ -5,74 +5,215 @@ Pipelines: handle scraped items
 """
 
 import os
-import json
 import redis
-import hashlib
+import asyncio
 import logging
+import multiprocessing
 from datetime import datetime
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from twisted.internet import task
+from twisted.internet.defer import Deferred
 from scrapy.exceptions import DropItem
 from itemadapter import ItemAdapter
+from vendor_scraper.utils.html_cleaner import clean_html
+from vendor_scraper.utils.metadata_buffer import MetadataBuffer
+from vendor_scraper.storage import load_storage
+from vendor_scraper.utils.digest_index import content_digest, load_digest_index
 
 
 class StoreHTMLPipeline:
-    """Pipeline: Save cleaned HTML content and metadata to Redis."""
+    """Pipeline: Save cleaned HTML content and metadata to Redis.
+
+    Pages are written through the backend named by ``HTML_STORAGE_BACKEND``
+    (see ``vendor_scraper.storage``); the metadata ``file_path`` is its locator.
+    With ``HTML_DIGEST_INDEX`` enabled, a page whose cleaned content matches the
+    last stored digest is not written again and its metadata is marked ``unchanged``.
+
+    Nothing blocking runs on the reactor thread: ``process_item`` returns a
+    Deferred, HTML cleaning runs in a process pool and the file write plus the
+    Redis push run in a bounded thread pool. When more than
+    ``HTML_PIPELINE_MAX_PENDING`` items are in flight the engine is paused until
+    the backlog drains to half of that.
+
+    Metadata is buffered and published with one pipelined RPUSH every
+    ``METADATA_FLUSH_RECORDS`` records or ``METADATA_FLUSH_INTERVAL_MS``, and on
+    spider close. Flush counters are exported as ``metadata/*`` stats.
+    """
 
     SERVER_FOLDER = r".\html_storage"
     LOCAL_FOLDER = "html_storage"
 
-    def __init__(self):
+    def __init__(self, crawler):
         self.redis_url = os.getenv("REDIS_URL")
         if not self.redis_url:
             raise ValueError("REDIS_URL is missing in environment variables")
         self.redis_client = redis.from_url(self.redis_url, decode_responses=True)
 
+        settings = crawler.settings
+        self.crawler = crawler
+        storage_path = settings.get("HTML_STORAGE_PATH") or (
+            self.SERVER_FOLDER
+            if os.path.exists(self.SERVER_FOLDER)
+            else self.LOCAL_FOLDER
+        )
+        self.storage = load_storage(
+            settings.get("HTML_STORAGE_BACKEND", "vendor_scraper.storage.FileSystemStorage"),
+            storage_path,
+            compression=settings.get("HTML_STORAGE_COMPRESSION", "zstd"),
+            max_pack_mb=settings.getint("HTML_STORAGE_PACK_MAX_MB", 1024),
+        )
+        self.digest_index = load_digest_index(
+            settings.get("HTML_DIGEST_INDEX"),
+            redis_client=self.redis_client,
+            key=settings.get("HTML_DIGEST_REDIS_KEY", "scrapy:html_digests"),
+            path=settings.get("HTML_DIGEST_INDEX_PATH", "html_digests.db"),
+        )
+        self.metadata_buffer = MetadataBuffer(
+            self.redis_client,
+            max_records=settings.getint("METADATA_FLUSH_RECORDS", 500),
+            max_delay_ms=settings.getint("METADATA_FLUSH_INTERVAL_MS", 1000),
+        )
+        self.flush_loop = task.LoopingCall(self._flush_metadata)
+        self.clean_processes = settings.getint("HTML_CLEAN_PROCESSES", 2)
+        self.write_threads = settings.getint("HTML_WRITE_THREADS", 4)
+        self.max_pending = settings.getint("HTML_PIPELINE_MAX_PENDING", 64)
+        self.clean_pool = None
+        self.io_pool = None
+        self.pending = 0
+        self.paused_engine = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def open_spider(self, spider):
+        self.io_pool = ThreadPoolExecutor(
+            max_workers=self.write_threads, thread_name_prefix="html-io"
+        )
+        # 0 processes: clean in the I/O threads instead (still off the reactor)
+        if self.clean_processes > 0:
+            self.clean_pool = ProcessPoolExecutor(
+                max_workers=self.clean_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            self.clean_pool = self.io_pool
+        self.flush_loop.start(self.metadata_buffer.max_delay, now=False)
+
+    def close_spider(self, spider):
+        if self.flush_loop.running:
+            self.flush_loop.stop()
+        if self.clean_pool is not self.io_pool:
+            self.clean_pool.shutdown(wait=True)
+        self.io_pool.shutdown(wait=True)
+        self.storage.close()
+        if self.digest_index:
+            self.digest_index.close()
+        self.metadata_buffer.flush()
+        self._export_metadata_stats()
+
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
         domain = adapter.get("domain")
         url = adapter.get("url_item")
         status = adapter.get("status_code")
         html_content = adapter.get("source_page_html")
+        fields = adapter.get("fields")
 
         if not all([domain, url, html_content]):
             raise DropItem(f"Incomplete item: {item}")
 
         logging.info(f"Storing URL: {url} (status: {status})")
 
-        try:
-            soup = BeautifulSoup(html_content, "html.parser")
-            for tag in soup(["video", "script", "iframe"]):
-                tag.decompose()
-            cleaned_html = soup.prettify()
-
-            storage_folder = (
-                self.SERVER_FOLDER
-                if os.path.exists(self.SERVER_FOLDER)
-                else self.LOCAL_FOLDER
+        self._acquire()
+        d = self._defer(self.clean_pool, clean_html, html_content)
+        d.addCallback(
+            lambda cleaned: self._defer(
+                self.io_pool, self._store, domain, url, status, cleaned, fields
             )
-            os.makedirs(os.path.join(storage_folder, domain), exist_ok=True)
-
-            hash_name = hashlib.sha256(url.encode("utf-8")).hexdigest() + ".html"
-            file_path = os.path.join(storage_folder, domain, hash_name)
-
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(cleaned_html)
-
+        )
+        d.addCallback(self._stored, item)
+        d.addErrback(self._store_failed, url)
+        d.addBoth(self._release)
+        return d
+
+    def _store(self, domain, url, status, cleaned_html, fields=None):
+        """Write the page and push its metadata (runs in the I/O thread pool).
+
+        ``fields`` holds the values of the site's "fields" rules (``utils/field_rules.py``);
+        it travels with the metadata and is loaded into the table's ``fields`` column.
+        """
+        digest = content_digest(cleaned_html)
+        previous = self.digest_index.get(url) if self.digest_index else None
+
+        if previous and previous[0] == digest:
+            file_path, crawl_status = previous[1], "unchanged"
+            logging.info(f"HTML unchanged, skipped write: {url}")
+        else:
+            file_path, crawl_status = self.storage.store(domain, url, cleaned_html), "success"
+            if self.digest_index:
+                self.digest_index.set(url, digest, file_path)
             logging.info(f"HTML saved: {file_path}")
 
-        except Exception as e:
-            logging.error(f"Error saving HTML for {url}: {e}")
-            raise DropItem(f"Failed to save HTML for {url}")
-
         metadata = {
             "url": url,
             "domain": domain,
             "file_path": file_path,
             "http_status": status,
             "saved_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "crawl_status": "success",
+            "crawl_status": crawl_status,
+            "content_digest": digest,
         }
+        if fields:
+            metadata["fields"] = fields
+
+        # Buffered; published to Redis in batches
+        self.metadata_buffer.add("scrapy:metadata", metadata)
+        return crawl_status
 
-        # Push metadata to Redis
-        self.redis_client.rpush("scrapy:metadata", json.dumps(metadata))
+    def _stored(self, crawl_status, item):
+        self.crawler.stats.inc_value(f"html/{crawl_status}")
         return item
+
+    def _flush_metadata(self):
+        """Periodic age-based flush, run in the I/O pool so Redis never blocks the reactor."""
+        self.io_pool.submit(self.metadata_buffer.flush_if_due)
+        self._export_metadata_stats()
+
+    def _export_metadata_stats(self):
+        stats = self.metadata_buffer.stats
+        for name, value in stats.items():
+            self.crawler.stats.set_value(f"metadata/{name}", value)
+        if stats["flushes"]:
+            self.crawler.stats.set_value(
+                "metadata/avg_flush_ms", stats["total_flush_ms"] / stats["flushes"]
+            )
+
+    def _store_failed(self, failure, url):
+        if failure.check(DropItem):
+            return failure
+        logging.error(f"Error saving HTML for {url}: {failure.value}")
+        raise DropItem(f"Failed to save HTML for {url}")
+
+    @staticmethod
+    def _defer(executor, func, *args):
+        """Run func in executor and return a Deferred fired on the reactor thread."""
+        return Deferred.fromFuture(asyncio.wrap_future(executor.submit(func, *args)))
+
+    def _acquire(self):
+        self.pending += 1
+        if self.pending >= self.max_pending and not self.paused_engine:
+            logging.info(f"{self.pending} items pending in StoreHTMLPipeline, pausing engine")
+            self.crawler.engine.pause()
+            self.paused_engine = True
+
+    def _release(self, result):
+        self.pending -= 1
+        if self.paused_engine and self.pending <= self.max_pending // 2:
+            logging.info(f"StoreHTMLPipeline backlog down to {self.pending}, resuming engine")
+            self.crawler.engine.unpause()
+            self.paused_engine = False
+            # Don't wait for the engine heartbeat to pick up new requests
+            if self.crawler.engine.slot:
+                self.crawler.engine.slot.nextcall.schedule()
+        return result
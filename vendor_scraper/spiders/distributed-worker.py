@@ -1,37 +1,120 @@
 """
 Spider: distributed_worker
 Description:
-    Worker spider dùng Scrapy-Redis để lấy URL từ Redis List `url_pools:start_urls`
-    và trích xuất dữ liệu HTML theo cấu hình DOM từ `DOM_site.json`.
+    Worker spider dùng Scrapy-Redis để lấy URL từ các Redis List theo domain
+    `url_pools:<domain>:start_urls` (xoay vòng công bằng giữa các domain, xem
+    `utils/domain_queues.py`) và từ List cũ `url_pools:start_urls`,
+    rồi trích xuất dữ liệu HTML theo cấu hình DOM từ `DOM_site.json`.
+
+    Mỗi domain có thể khai báo tốc độ riêng trong `DOM_site.json`:
+        "crawl": {"concurrency": 4, "download_delay": 0.5}
+
+    Trang không khớp selector `SOURCE_PAGE` (nội dung render bằng JS) được chuyển
+    sang hàng đợi của `playwright_worker`; domain nào thường xuyên cần trình duyệt
+    sẽ được đưa thẳng sang đó (xem `utils/fetch_router.py`), hoặc cố định bằng
+        "fetch": "http" | "browser"
+
+    Các trường sản phẩm khai báo trong `"fields"` của `DOM_site.json` được trích
+    xuất ngay khi parse vào `item["fields"]` (xem `utils/field_rules.py`).
 """
 
+import os
 import json
 import scrapy
 import logging
+import itertools
+from collections import Counter, defaultdict
 from urllib.parse import urlparse
+from twisted.internet import reactor
+from scrapy import signals
 from scrapy_redis.spiders import RedisSpider
 from scrapy.loader import ItemLoader
 from vendor_scraper.items import ProductItem
+from vendor_scraper.utils.canonical_url import canonicalize_url
+from vendor_scraper.utils.domain_queues import DOMAIN_RING_KEY, DomainRing, domain_of, domain_queue_key
+from vendor_scraper.utils.fetch_router import BROWSER, HTTP, FetchRouter
+from vendor_scraper.utils.site_config import get_registry
 
 
 class VendorSpider(RedisSpider):
     name = "distributed-worker"
     redis_key = "url_pools:start_urls"
-    redis_batch_size = 1
+    redis_batch_size = 200  # Max URLs popped per Redis round trip
     max_idle_time = 7  # Seconds worker will wait before stopping when idle
 
+    # Each domain may hold this many times its slot concurrency in flight
+    queue_depth_factor = 2
+    # Refill from Redis once in-flight drops below this fraction of the target
+    refill_watermark = 0.5
+
     custom_settings = {
         "LOG_LEVEL": "INFO",
-        "DOWNLOAD_DELAY": 2,  # Slight delay to avoid flooding
         "RETRY_ENABLED": True,
         "RETRY_TIMES": 2,
     }
 
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        # Per-domain concurrency / delay from DOM_site.json -> downloader slots
+        try:
+            sites = get_registry()
+        except (OSError, json.JSONDecodeError):
+            return
+        slots = dict(settings.getdict("DOWNLOAD_SLOTS"))
+        for site in sites:
+            crawl = site.crawl
+            slot = {}
+            if "concurrency" in crawl:
+                slot["concurrency"] = int(crawl["concurrency"])
+            if "download_delay" in crawl:
+                slot["delay"] = float(crawl["download_delay"])
+            if slot:
+                slots.setdefault(site.domain, slot)
+        settings.set("DOWNLOAD_SLOTS", slots, priority="spider")
+
+    def setup_redis(self, crawler=None):
+        super().setup_redis(crawler)
+        crawler = crawler or self.crawler
+        self.ring = DomainRing(self.server)
+        # popped: taken from Redis, not yet handed to the scheduler
+        # inflight: scheduled (incl. retries/redirects), not yet finished; counted per
+        # popped URL through the "queue_token" meta key that its retry/redirect copies inherit
+        # unstarted: token -> (shard domain, or None for the legacy list, and the raw entry) for
+        # popped URLs that never reached the downloader (only until scheduled when
+        # SCHEDULER_PERSIST keeps the scheduler queue)
+        self.popped = Counter()
+        self.inflight = Counter()
+        self.inflight_tokens = {}
+        self.unstarted = {}
+        # Unique per run: requests persisted by an earlier run carry their own tokens
+        self._token_prefix = f"{os.getpid()}-{os.urandom(4).hex()}"
+        self._tokens = itertools.count()
+        self._refill_pending = False
+        self.target_inflight = crawler.settings.getint("CONCURRENT_REQUESTS") * self.queue_depth_factor
+        self.return_scheduled = not crawler.settings.getbool("SCHEDULER_PERSIST")
+        self.default_domain_concurrency = crawler.settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN")
+        self.slot_settings = crawler.settings.getdict("DOWNLOAD_SLOTS")
+        self.router = (
+            FetchRouter.from_settings(crawler.settings, self.server)
+            if crawler.settings.getbool("FETCH_ROUTER_ENABLED") else None
+        )
+        # Idle check must see the sharded queues, not only the legacy list
+        self.count_size = lambda key: self.ring.queued_count([key])
+        crawler.signals.connect(self._request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(self._request_started, signal=signals.request_reached_downloader)
+        crawler.signals.connect(self._request_finished, signal=signals.request_left_downloader)
+        crawler.signals.connect(self._request_finished, signal=signals.request_dropped)
+        # Responses returned by a downloader middleware (cache hits...) never enter a slot
+        crawler.signals.connect(self._response_received, signal=signals.response_received)
+        crawler.signals.connect(self._return_unstarted, signal=signals.spider_closed)
+        crawler.signals.connect(self._sync_routes, signal=signals.spider_closed)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         try:
-            with open("vendor_scraper/configs/DOM_site.json", "r", encoding="utf-8") as f:
-                self.website_configs = json.load(f)
+            # Registry index theo host, tự nạp lại khi DOM_site.json thay đổi
+            self.sites = get_registry()
         except FileNotFoundError:
             logging.critical("DOM_site.json not found! Spider will exit.")
             raise
@@ -39,11 +122,186 @@ class VendorSpider(RedisSpider):
             logging.critical("Error decoding DOM_site.json — please check the format.")
             raise
 
+    def next_requests(self):
+        """Pop enough URLs to fill the free slots, dealt round-robin across domain queues.
+
+        The batch is the gap between target_inflight (CONCURRENT_REQUESTS x
+        queue_depth_factor) and what is already popped or in flight, capped at
+        redis_batch_size. Domains already holding queue_depth_factor x their slot
+        concurrency are skipped; any remaining budget is taken from the legacy list.
+        """
+        budget = min(self.redis_batch_size, self.target_inflight - self.outstanding())
+        if budget <= 0:
+            return
+
+        domains = self.ring.domains()
+        capacity = {
+            d: self._domain_capacity(d) - self.inflight[d] - self.popped[d] for d in domains
+        }
+        quotas = self.ring.allocate(domains, budget, capacity)
+        datas = self.ring.pop(quotas)
+        sharded = len(datas)
+
+        remaining = budget - len(datas)
+        if remaining > 0:
+            datas += self.fetch_data(self.redis_key, remaining)
+
+        requests = []
+        browser_requests = []
+        for i, data in enumerate(datas):
+            request = self.make_request_from_data(data)
+            if not isinstance(request, scrapy.Request):
+                self.logger.debug(f"Request not made from data: {data}")
+                continue
+            domain = domain_of(request.url)
+            request.meta["queue_domain"] = domain
+            request.meta["queue_token"] = f"{self._token_prefix}-{next(self._tokens)}"
+            # Raw entry goes back to the list it came from if the URL is never started
+            request.meta["queue_entry"] = (domain if i < sharded else None, data)
+            if request.errback is None:
+                # Download errors raised before the request enters a slot fire no signal
+                request = request.replace(errback=self._request_failed)
+            if self.router is not None and self.router.route(domain, self.sites.lookup(domain)) == BROWSER:
+                # Domain đã học là cần trình duyệt: chuyển thẳng sang playwright_worker
+                browser_requests.append(request)
+            else:
+                requests.append(request)
+
+        if browser_requests:
+            if self.router.escalate(r.url for r in browser_requests):
+                # Đã nằm trong hàng đợi trình duyệt: không trả lại danh sách gốc
+                for request in browser_requests:
+                    request.meta.pop("queue_entry", None)
+                self.crawler.stats.inc_value("route/browser_direct", len(browser_requests))
+            else:
+                requests += browser_requests  # Redis lỗi: vẫn tải bằng HTTP
+
+        for request in requests:
+            domain = request.meta["queue_domain"]
+            self.popped[domain] += 1
+            self.unstarted[request.meta["queue_token"]] = request.meta.pop("queue_entry")
+
+        if datas:
+            self.crawler.stats.inc_value("redis/popped", len(datas))
+            self.crawler.stats.max_value("redis/max_batch", len(datas))
+            self.logger.debug(
+                f"Read {len(datas)} requests from {len(quotas)} domain queue(s), "
+                f"{self.outstanding()} outstanding"
+            )
+        yield from requests
+
+    def outstanding(self):
+        return sum(self.popped.values()) + sum(self.inflight.values())
+
+    def _domain_capacity(self, domain):
+        # Live slot concurrency first: AdaptiveThrottle moves it at runtime
+        slot = self.crawler.engine.downloader.slots.get(domain)
+        if slot is not None:
+            concurrency = slot.concurrency
+        else:
+            concurrency = self.slot_settings.get(domain, {}).get(
+                "concurrency", self.default_domain_concurrency
+            )
+        return concurrency * self.queue_depth_factor
+
+    def _request_scheduled(self, request, spider):
+        domain = request.meta.get("queue_domain")
+        token = request.meta.get("queue_token")
+        if domain is None or token is None:
+            return
+        if not request.meta.get("queue_scheduled"):
+            # First time this popped URL enters the scheduler; retry/redirect
+            # copies inherit the flag but still count as in flight
+            request.meta["queue_scheduled"] = True
+            if self.popped[domain] > 0:
+                self.popped[domain] -= 1
+            if not self.return_scheduled:
+                self.unstarted.pop(token, None)
+        if token not in self.inflight_tokens:
+            # A redirect issued from process_request reuses the token of a request that
+            # never finished, so it is not counted twice
+            self.inflight_tokens[token] = domain
+            self.inflight[domain] += 1
+
+    def _request_started(self, request, spider):
+        self.unstarted.pop(request.meta.get("queue_token"), None)
+
+    def _request_finished(self, request, spider):
+        # Idempotent: a download may be reported by several of these hooks
+        token = request.meta.get("queue_token")
+        domain = self.inflight_tokens.pop(token, None)
+        if domain is not None:
+            self.inflight[domain] -= 1
+        self.unstarted.pop(token, None)
+        self._maybe_refill()
+
+    def _response_received(self, response, request, spider):
+        self._request_finished(request, spider)
+
+    def _request_failed(self, failure):
+        request = getattr(failure, "request", None)
+        if request is not None:
+            self._request_finished(request, self)
+        # Returning the same failure keeps Scrapy's download error logging
+        return failure
+
+    def _maybe_refill(self):
+        """Top up from Redis as soon as slots free up instead of waiting for spider_idle."""
+        if self._refill_pending or self.outstanding() > self.target_inflight * self.refill_watermark:
+            return
+        self._refill_pending = True
+        reactor.callLater(0, self._refill)
+
+    def _refill(self):
+        self._refill_pending = False
+        engine = self.crawler.engine
+        if engine.spider is not self or engine.slot is None or engine.slot.closing:
+            return
+        self.schedule_next_requests()
+
+    def _return_unstarted(self, spider, reason):
+        """Push popped entries that never reached the downloader back to the list they came from.
+
+        The raw entry is returned as popped, so JSON url/meta payloads survive.
+
+        With SCHEDULER_PERSIST the scheduler queue keeps what it already holds, so
+        only URLs that were never scheduled are returned.
+        """
+        entries = defaultdict(list)
+        for domain, data in self.unstarted.values():
+            entries[domain].append(data)
+        if not entries:
+            return
+        with self.server.pipeline(transaction=False) as pipe:
+            for domain, datas in entries.items():
+                pipe.lpush(domain_queue_key(domain) if domain else self.redis_key, *datas)
+            domains = [domain for domain in entries if domain]
+            if domains:
+                pipe.sadd(DOMAIN_RING_KEY, *domains)
+            pipe.execute()
+        self.logger.info(f"Returned {len(self.unstarted)} unstarted URLs to Redis ({reason})")
+        self.unstarted.clear()
+
+    def _sync_routes(self, spider, reason):
+        if self.router is None:
+            return
+        self.router.sync()
+        for domain, counts in sorted(self.router.summary().items()):
+            self.logger.debug(f"Fetch route {domain}: {counts}")
+
+    def make_request_from_data(self, data):
+        # Idle-time refills are scheduled via engine.crawl() and skip spider
+        # middlewares, so canonicalize here as well as in CanonicalUrlMiddleware
+        request = super().make_request_from_data(data)
+        if isinstance(request, scrapy.Request):
+            url = canonicalize_url(request.url)
+            if url != request.url:
+                request = request.replace(url=url)
+        return request
+
     def parse(self, response):
         domain = urlparse(response.url).netloc
-        config = next(
-            (c for c in self.website_configs["website"] if c["domain"] == domain), None
-        )
+        config = self.sites.lookup(domain)
 
         if not config:
             logging.warning(f"No configuration found for domain: {domain}")
@@ -54,12 +312,23 @@ class VendorSpider(RedisSpider):
         loader.add_value("url_item", response.url)
         loader.add_value("status_code", response.status)
 
-        selector = config["selectors"].get("SOURCE_PAGE")
-        if not selector:
+        xpath = config.xpath("SOURCE_PAGE")
+        if not xpath:
             logging.warning(f"No SOURCE_PAGE selector found for {domain}")
             return
 
-        logging.info(f"Parsing {response.url} using selector: {selector}")
-        loader.add_css("source_page_html", selector)
+        if self.router is not None:
+            # Selector không khớp: nội dung cần JS, chuyển URL sang playwright_worker
+            matched = bool(response.xpath(xpath))
+            self.router.record(response.meta.get("queue_domain") or domain_of(response.url), HTTP, matched)
+            if not matched and self.router.escalate([response.url]):
+                self.crawler.stats.inc_value("route/escalated")
+                logging.info(f"SOURCE_PAGE not found in {response.url}, escalated to browser queue")
+                return
+
+        logging.info(f"Parsing {response.url} using selector: {config.selectors['SOURCE_PAGE']}")
+        loader.add_xpath("source_page_html", xpath)
+        if config.fields:
+            loader.add_value("fields", config.extract(response))
 
         yield loader.load_item()
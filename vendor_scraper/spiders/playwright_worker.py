@@ -1,27 +1,29 @@
 import os
-import json
-import hashlib
 import redis
+import redis.asyncio as aioredis
 import random
 import logging
 import asyncio
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from urllib.parse import urlparse
-from bs4 import BeautifulSoup
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 from playwright_stealth import stealth_async
 from dotenv import load_dotenv
-from contextlib import contextmanager
+from vendor_scraper.utils.html_cleaner import clean_html
+from vendor_scraper.utils.metadata_buffer import MetadataBuffer
+from vendor_scraper.storage import load_storage
+from vendor_scraper.utils.header_profiles import get_provider
+from vendor_scraper.utils.site_config import get_registry
+from vendor_scraper.utils.loop_lag import LoopLagMonitor
+from vendor_scraper.utils.fetch_router import BROWSER, FetchRouter
+from vendor_scraper.utils.process_memory import children_rss_mb
+from vendor_scraper.utils.storage_state import StorageStateStore
 
 load_dotenv()
 
-try:
-    from fake_useragent import UserAgent
-    ua = UserAgent()
-    use_fake_ua = True
-except ImportError:
-    use_fake_ua = False
-
 # Configuration
 CONFIG = {
     # Browser configuration
@@ -53,53 +55,171 @@ CONFIG = {
     
     # Redis configuration
     "redis_url": os.getenv("REDIS_URL"), # Connect to Redis server
-    "url_pools": "url_amazon:start_urls", # URLs pool
+    "url_pools": os.getenv("PLAYWRIGHT_URL_POOL", "url_amazon:start_urls"), # URLs pool (FETCH_ROUTER_BROWSER_QUEUE / _QUEUES)
+    "route_stats_key": "route:domains", # Browser outcomes for the fetch router (FETCH_ROUTER_REDIS_KEY)
+    "storage_state_key": "browser:storage_state", # Per-domain cookies + localStorage shared by all workers
+    "storage_state_ttl": 86400, # Ignore snapshots older than this (s)
+    "storage_state_save_interval": 300, # Snapshot a domain at most every N seconds per worker
     "metadata_crawler": "url_amazon:metadata", # Metadata storage queue
+    "metadata_flush_records": 200, # Publish metadata every N records...
+    "metadata_flush_interval_ms": 5000, # ...or when the oldest buffered record is this old
+    "redis_batch_size": 50, # Max URLs popped per round trip (LPOP count)
+
+    # Executors: keep blocking work off the event loop
+    "clean_processes": 2, # HTML cleaning processes (0 = clean in the I/O threads)
+    "io_threads": 4, # Storage writes and metadata flushes
+    "loop_lag_interval": 0.5, # Event-loop lag sampling period (s)
+    "loop_lag_report": 60, # Log a lag summary every N seconds
     # "storage_folder": "html", # HTML storage folder
     "storage_folder": "//172.16.9.61/02_Picture_Lookup/Crawling/html_storage", # HTML storage folder
+    "storage_backend": "vendor_scraper.storage.FileSystemStorage", # or vendor_scraper.storage.PackStorage
+    "storage_compression": "zstd", # PackStorage only: zstd, gzip or none
     
+    # Concurrency: browsers x contexts_per_browser x pages_per_context pages render in parallel
+    "browsers": 1, # Browser processes
+    "contexts_per_browser": 2, # Isolated contexts (cookies, cache) per browser
+    "pages_per_context": 3, # Pages (tabs) per context
+    "domain_concurrency": 2, # Max pages loading the same domain at once
+    "page_pause": (1, 3), # Random pause (s) before the same domain slot takes the next URL
+
+    # Rendering: abort what save_html never keeps, stop waiting once the product DOM is there
+    "block_resource_types": ["image", "media", "font"], # Playwright resource types to abort
+    "block_hosts": [ # Ad / analytics hosts (subdomains included)
+        "google-analytics.com", "googletagmanager.com", "googleadservices.com",
+        "doubleclick.net", "googlesyndication.com", "facebook.net", "connect.facebook.net",
+        "hotjar.com", "clarity.ms", "bat.bing.com", "segment.io", "segment.com",
+        "newrelic.com", "nr-data.net", "optimizely.com", "criteo.com", "criteo.net",
+        "taboola.com", "outbrain.com", "adsrvr.org", "amazon-adsystem.com",
+        "scorecardresearch.com", "quantserve.com", "demdex.net", "omtrdc.net",
+    ],
+    "wait_until": "domcontentloaded", # Default goto wait; per domain: "render": {"wait_until": ...}
+    "goto_timeout": 30000, # ms
+    "selector_timeout": 15000, # ms to wait for the SOURCE_PAGE selector after goto
+
     # Retries settings
     "max_retries": 2,
     "base_wait_time": 5, # base duration between retries
-    "max_urls_before_restart": 1000,
-    "pause_every": 20000,
-    "pause_duration": 180,
+
+    # Context / browser recycling on measured signals
+    "memory_limit_mb": 4096, # Summed RSS of the browser processes that triggers recycling
+    "memory_check_interval": 15, # Seconds between RSS checks
+    "recycle_cooldown": 60, # Seconds between memory-driven recycles (lets RSS settle)
+    "browser_restart_min_urls": 50, # Over the limit with no context older than this: restart the browser
+    "browser_restart_cooldown": 600, # ...at most once per this many seconds
+    "context_error_rate": 0.5, # Recycle a context whose navigation failure rate (EWMA) exceeds this
+    "context_error_min_urls": 20, # ...once it has served at least this many URLs
 }
 
 # Validate configuration
 def validate_config():
     if CONFIG["browser_type"] not in ["chromium", "firefox"]:
         raise ValueError(f"Invalid browser_type: {CONFIG['browser_type']}. Must be 'chromium' or 'firefox'.")
+    for key in ("browsers", "contexts_per_browser", "pages_per_context", "domain_concurrency"):
+        if CONFIG[key] <= 0:
+            raise ValueError(f"{key} must be positive")
     if CONFIG["max_retries"] < 0:
         raise ValueError("max_retries must be non-negative")
     if CONFIG["base_wait_time"] <= 0:
         raise ValueError("base_wait_time must be positive")
-    if CONFIG["max_urls_before_restart"] <= 0:
-        raise ValueError("max_urls_before_restart must be positive")
-    if CONFIG["pause_every"] <= 0:
-        raise ValueError("pause_every must be positive")
-    if CONFIG["pause_duration"] <= 0:
-        raise ValueError("pause_duration must be positive")
+    if CONFIG["memory_limit_mb"] <= 0 or CONFIG["memory_check_interval"] <= 0:
+        raise ValueError("memory_limit_mb and memory_check_interval must be positive")
+    if not 0 < CONFIG["context_error_rate"] <= 1:
+        raise ValueError("context_error_rate must be in (0, 1]")
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize Redis client
-try:
-    redis_client = redis.from_url(CONFIG["redis_url"], decode_responses=True)
-except redis.RedisError as e:
-    logger.error(f"Failed to connect to Redis: {str(e)}")
-    raise
+# Runtime objects, created by setup() in the main process only: the spawn processes of
+# clean_pool re-import this module and must not open Redis clients, pools or storage
+redis_client = async_redis = None
+io_pool = clean_pool = None
+fetch_router = storage_states = metadata_buffer = html_storage = None
+header_profiles = site_registry = None
+
+
+def setup():
+    """Create the Redis clients, executors, storage and registries used by the crawl."""
+    global redis_client, async_redis, io_pool, clean_pool
+    global fetch_router, storage_states, metadata_buffer, html_storage, header_profiles, site_registry
+
+    # Initialize Redis clients: asyncio for the URL queue, sync for the metadata buffer
+    # (it is only ever flushed from the I/O threads)
+    try:
+        redis_client = redis.from_url(CONFIG["redis_url"], decode_responses=True)
+        async_redis = aioredis.from_url(CONFIG["redis_url"], decode_responses=True)
+    except redis.RedisError as e:
+        logger.error(f"Failed to connect to Redis: {str(e)}")
+        raise
+
+    io_pool = ThreadPoolExecutor(max_workers=CONFIG["io_threads"], thread_name_prefix="pw-io")
+    clean_pool = (
+        ProcessPoolExecutor(
+            max_workers=CONFIG["clean_processes"],
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        if CONFIG["clean_processes"] > 0 else io_pool
+    )
+
+    # Reports whether SOURCE_PAGE appeared after rendering (synced from the I/O threads)
+    fetch_router = FetchRouter(redis_client, browser_queue=CONFIG["url_pools"], stats_key=CONFIG["route_stats_key"])
+
+    # Warm start for new contexts: cookies / localStorage earned by earlier sessions
+    storage_states = StorageStateStore(
+        async_redis,
+        CONFIG["storage_state_key"],
+        ttl=CONFIG["storage_state_ttl"],
+        save_interval=CONFIG["storage_state_save_interval"],
+    )
+
+    metadata_buffer = MetadataBuffer(
+        redis_client,
+        max_records=CONFIG["metadata_flush_records"],
+        max_delay_ms=CONFIG["metadata_flush_interval_ms"],
+    )
+
+    html_storage = load_storage(
+        CONFIG["storage_backend"],
+        CONFIG["storage_folder"],
+        compression=CONFIG["storage_compression"],
+    )
+
+    header_profiles = get_provider(os.getenv("HEADER_PROFILES_CACHE"))
+    site_registry = get_registry()
+
+blocked_types = frozenset(CONFIG["block_resource_types"])
+blocked_hosts = frozenset(CONFIG["block_hosts"])
+route_stats = defaultdict(int)
+
+
+#### Request routing
+def is_blocked_host(url):
+    """True if the URL's host or one of its parent domains is in block_hosts."""
+    host = urlparse(url).hostname or ""
+    labels = host.split(".")
+    return any(".".join(labels[i:]) in blocked_hosts for i in range(len(labels) - 1))
+
+
+async def block_resources(route):
+    """Abort images/media/fonts and tracker requests; let everything else through."""
+    request = route.request
+    if request.resource_type in blocked_types:
+        route_stats[f"blocked_{request.resource_type}"] += 1
+        await route.abort()
+    elif is_blocked_host(request.url):
+        route_stats["blocked_host"] += 1
+        await route.abort()
+    else:
+        route_stats["allowed"] += 1
+        await route.continue_()
 
 # Function to get a random User-Agent
 def get_random_user_agent():
-    """Get a random User-Agent if fake_useragent is available."""
-    if use_fake_ua:
-        try:
-            return ua.random
-        except Exception as e:
-            logger.error(f"Error getting random User-Agent: {str(e)}")
+    """Get a random User-Agent from the local header profile cache."""
+    try:
+        return header_profiles.random_user_agent()
+    except Exception as e:
+        logger.error(f"Error getting random User-Agent: {str(e)}")
     return None
 
 
@@ -212,117 +332,303 @@ async def simulate_user_behavior(page):
         logger.warning(f"Failed to simulate user behavior: {str(e)}")
 
 
-#### Initialize browser and context
-async def initialize_browser(playwright, browser_type, headless, args, context_settings):
-    """Initialize the browser and context."""
+#### Launch browser
+async def launch_browser(playwright, browser_type, headless, args):
+    """Launch one browser process."""
     try:
         browser_launcher = (
             playwright.chromium if browser_type == "chromium" else playwright.firefox
         )
         browser = await browser_launcher.launch(headless=headless, args=args)
-        context = await browser.new_context(**context_settings)
-        page = await context.new_page()
-        await stealth_async(page)
-        
-        logger.info(f"Initialized {browser_type} browser")
-        return browser, context, page
-    
+        logger.info(f"Launched {browser_type} browser")
+        return browser
+
     except Exception as e:
-        logger.error(f"Failed to initialize {browser_type} browser: {str(e)}")
+        logger.error(f"Failed to launch {browser_type} browser: {str(e)}")
         raise
 
+
+class ContextSlot:
+    """One browser context and its pages."""
+
+    def __init__(self, browser, context, pages):
+        self.browser = browser
+        self.context = context
+        self.pages = pages
+        self.user_agent = get_random_user_agent() # User-Agent recorded for this session
+        self.in_use = 0
+        self.urls = 0
+        self.error_rate = 0.0 # EWMA of navigation / browser failures (LOAD_FAILED)
+        self.domains = set() # Domains loaded successfully (their storage state is saved on close)
+        self.retiring = False
+        self.closed = False
+
+
+class PagePool:
+    """Bounded pool of ready pages spread over several browsers and contexts.
+
+    A URL borrows one page and gives it back. Contexts are recycled on measured
+    signals instead of a URL counter:
+    - memory: when the browsers' summed RSS exceeds memory_limit_mb, the context that
+      has served the most URLs is retired; if even the oldest context is fresh
+      (browser_restart_min_urls), the whole browser is replaced instead
+    - errors: a context whose navigation failure rate passes context_error_rate is
+      retired (HTTP errors and missing selectors are the site's answer, not the context's)
+    The replacement context is opened (pre-warmed) before the old one is drained,
+    so recycling never leaves the pool short of pages.
+    """
+
+    def __init__(self, playwright):
+        self.playwright = playwright
+        self.browsers = []
+        self.slots = []
+        self.size = CONFIG["browsers"] * CONFIG["contexts_per_browser"] * CONFIG["pages_per_context"]
+        self.idle = asyncio.Queue()
+        self.stats = defaultdict(int)
+        self._last_recycle = 0.0
+        self._last_restart = float("-inf")
+        self._monitor = None
+
+    async def start(self):
+        for _ in range(CONFIG["browsers"]):
+            await self._open_browser()
+        self._monitor = asyncio.create_task(self._watch_memory())
+        logger.info(
+            f"Page pool ready: {len(self.browsers)} browser(s), {len(self.slots)} context(s), {self.size} page(s)"
+        )
+
+    async def _open_browser(self):
+        browser = await launch_browser(
+            self.playwright, CONFIG["browser_type"], CONFIG["headless"], CONFIG["browser_args"]
+        )
+        self.browsers.append(browser)
+        for _ in range(CONFIG["contexts_per_browser"]):
+            await self._open_slot(browser)
+        return browser
+
+    async def _open_slot(self, browser):
+        state = await storage_states.load()
+        context = await browser.new_context(**CONFIG["context_settings"], storage_state=state)
+        if blocked_types or blocked_hosts:
+            await context.route("**/*", block_resources)
+        pages = []
+        try:
+            for _ in range(CONFIG["pages_per_context"]):
+                page = await context.new_page()
+                await stealth_async(page)
+                pages.append(page)
+        except Exception:
+            await context.close() # Do not leak a half-opened context
+            raise
+        slot = ContextSlot(browser, context, pages)
+        self.slots.append(slot)
+        for page in pages:
+            self.idle.put_nowait((slot, page))
+        return slot
+
+    async def acquire(self):
+        while True:
+            slot, page = await self.idle.get()
+            if not slot.retiring: # Idle pages of a retired context are dropped
+                break
+        slot.in_use += 1
+        return slot, page
+
+    async def release(self, slot, page, ok=True):
+        slot.in_use -= 1
+        slot.urls += 1
+        slot.error_rate = 0.9 * slot.error_rate + (0.0 if ok else 0.1)
+        if (
+            not slot.retiring
+            and slot.urls >= CONFIG["context_error_min_urls"]
+            and slot.error_rate > CONFIG["context_error_rate"]
+        ):
+            self.stats["recycled_errors"] += 1
+            try:
+                await self._retire(slot, f"error rate {slot.error_rate:.2f}")
+            except Exception:
+                pass # Already logged; the old context keeps serving until a later retry
+        if not slot.retiring:
+            self.idle.put_nowait((slot, page))
+        elif slot.in_use == 0:
+            await self._close_slot(slot)
+
+    async def _retire(self, slot, reason):
+        """Open the replacement context first, then drain and close the old one."""
+        slot.retiring = True
+        self._last_recycle = asyncio.get_running_loop().time()
+        logger.info(f"Recycling browser context after {slot.urls} URLs ({reason})")
+        try:
+            browser = slot.browser if slot.browser in self.browsers else self.browsers[-1]
+            await self._open_slot(browser)
+        except Exception as e:
+            # Keep the old context: dropping it without a replacement would shrink the pool
+            slot.retiring = False
+            logger.error(f"Failed to open replacement browser context: {str(e)}")
+            raise
+        if slot.in_use == 0:
+            await self._close_slot(slot)
+
+    async def _close_slot(self, slot):
+        if slot.closed:
+            return
+        slot.closed = True
+        self.slots.remove(slot)
+        await storage_states.save(slot.context, slot.domains)
+        try:
+            await slot.context.close()
+        except Exception as e:
+            logger.warning(f"Failed to close browser context: {str(e)}")
+        # A replaced browser is closed once its last context is gone
+        if slot.browser not in self.browsers and not any(s.browser is slot.browser for s in self.slots):
+            try:
+                await slot.browser.close()
+                logger.info("Closed replaced browser")
+            except Exception as e:
+                logger.warning(f"Failed to close browser: {str(e)}")
+
+    async def _restart_browser(self, browser, rss):
+        """Launch a fresh browser with its contexts, then retire every context of the old one."""
+        logger.info(f"Browser RSS {rss:.0f} MB stays above the limit with fresh contexts, replacing browser")
+        self.browsers.remove(browser)
+        self._last_recycle = asyncio.get_running_loop().time()
+        self.stats["browser_restarts"] += 1
+        try:
+            await self._open_browser()
+        except Exception:
+            self.browsers.append(browser)
+            raise
+        for slot in [s for s in self.slots if s.browser is browser]:
+            slot.retiring = True
+            if slot.in_use == 0:
+                await self._close_slot(slot)
+
+    async def _watch_memory(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(CONFIG["memory_check_interval"])
+            try:
+                rss = await loop.run_in_executor(io_pool, children_rss_mb)
+                if rss is None:
+                    logger.warning("Browser memory cannot be measured here (install psutil); memory recycling disabled")
+                    return
+                self.stats["peak_rss_mb"] = max(self.stats["peak_rss_mb"], int(rss))
+                if rss <= CONFIG["memory_limit_mb"] or loop.time() - self._last_recycle < CONFIG["recycle_cooldown"]:
+                    continue
+                candidates = [s for s in self.slots if not s.retiring]
+                if not candidates:
+                    continue
+                oldest = max(candidates, key=lambda s: s.urls)
+                if oldest.urls < CONFIG["browser_restart_min_urls"]:
+                    if loop.time() - self._last_restart < CONFIG["browser_restart_cooldown"]:
+                        # A fresh browser did not help: the limit is below the working set
+                        self.stats["over_limit_checks"] += 1
+                        continue
+                    self._last_restart = loop.time()
+                    await self._restart_browser(oldest.browser, rss)
+                else:
+                    self.stats["recycled_memory"] += 1
+                    await self._retire(oldest, f"browser RSS {rss:.0f} MB")
+            except Exception as e:
+                logger.error(f"Browser memory check failed: {str(e)}")
+
+    async def close(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+        for slot in self.slots:
+            await storage_states.save(slot.context, slot.domains)
+            try:
+                await slot.context.close()
+            except Exception as e:
+                logger.warning(f"Failed to close browser context: {str(e)}")
+        for browser in {slot.browser for slot in self.slots} | set(self.browsers):
+            await browser.close()
+
+
 #### Load page with retries and exponential backoff
+LOAD_OK = "ok"
+LOAD_HTTP_ERROR = "http_error" # The site answered with an error status
+LOAD_NO_SELECTOR = "no_selector" # The page loaded without the SOURCE_PAGE selector
+LOAD_FAILED = "failed" # Navigation or browser failure (timeout, network error, crashed page)
+
+
 async def load_page_with_retry(page, url, max_retries, base_wait_time):
-    """Load a page with retries and exponential backoff."""
+    """Load a page with retries and exponential backoff; returns a LOAD_* outcome.
+
+    Waits for CONFIG["wait_until"] (or the domain's "render": {"wait_until": ...} in
+    DOM_site.json), then for the domain's SOURCE_PAGE selector to be attached. The
+    outcome of the last attempt is returned.
+    """
+    site = site_registry.lookup(url)
+    render = site.raw.get("render", {}) if site else {}
+    wait_until = render.get("wait_until", CONFIG["wait_until"])
+    selector = site.selectors.get("SOURCE_PAGE") if site and render.get("wait_for_selector", True) else None
+
+    outcome = LOAD_FAILED
     for attempt in range(max_retries):
+        outcome = LOAD_FAILED
         user_agent = get_random_user_agent()
         headers = {"User-Agent": user_agent} if user_agent else {}
         logger.info(f"Attempt {attempt + 1} for {url} with User-Agent: {user_agent or 'default'}")
-        await page.context.set_extra_http_headers(headers)
-        
-        cookies = await page.context.cookies()
-        await page.context.add_cookies(cookies)
-        logger.info(f"Loaded {len(cookies)} cookies for {url}")
+        # Page-level headers: the context is shared with the other pages of its slot
+        # (cookies come with the context from the shared storage state)
+        await page.set_extra_http_headers(headers)
 
         try:
-            response = await page.goto(url, timeout=70000, wait_until="networkidle")
+            response = await page.goto(url, timeout=CONFIG["goto_timeout"], wait_until=wait_until)
             
             if response and response.status in [404, 500]:
                 logger.error(f"HTTP error {response.status} for {url}. Skipping retries.")
-                return False
+                return LOAD_HTTP_ERROR
             if response and response.status >= 400:
+                outcome = LOAD_HTTP_ERROR
                 raise Exception(f"HTTP error: {response.status}")
+            if selector:
+                outcome = LOAD_NO_SELECTOR
+                await page.wait_for_selector(selector, timeout=CONFIG["selector_timeout"], state="attached")
             
+            outcome = LOAD_FAILED
             await simulate_user_behavior(page) # Simaulate user behavior after loading the page
-            return True
+            return LOAD_OK
         
         except PlaywrightTimeoutError as e:
             logger.warning(f"Timeout loading {url}: {str(e)}")
         except Exception as e:
             logger.error(f"Error loading {url}: {str(e)}")
+            if outcome == LOAD_NO_SELECTOR:
+                outcome = LOAD_FAILED # The page broke while waiting, not a missing selector
 
         if attempt < max_retries - 1:
             wait_time = base_wait_time * (2 ** attempt) + random.uniform(1, 3)
             logger.info(f"Retrying after {wait_time:.2f}s... ({attempt + 2}/{max_retries})")
             await asyncio.sleep(wait_time)
-    return False
+    return outcome
 
 
 #### Save HTML content
-async def save_html(url, html, storage_folder):
-    """Save cleaned HTML content to a file."""
+async def save_html(url, html):
+    """Save cleaned HTML content through the configured storage backend."""
     try:
         # Check if HTML content is valid
         if not html or not isinstance(html, str):
             logger.error(f"Invalid HTML content for {url}: {html}")
             return None
 
-        soup = BeautifulSoup(html, "html.parser")
-        for tag in soup(["script", "video"]):
-            tag.decompose()
-        
-        # Use prettify() instead of pretty_print()
-        cleaned_html = soup.prettify()
-
-        domain = urlparse(url).netloc
-        domain_folder = os.path.join(storage_folder, domain)
-        os.makedirs(domain_folder, exist_ok=True)
-
-        hash_filename = hashlib.sha256(url.encode("utf-8")).hexdigest() + ".html"
-        file_path = os.path.join(domain_folder, hash_filename)
-
-        with file_writer(file_path) as f:
-            if f:
-                f.write(cleaned_html)
-                logger.info(f"Stored HTML: {file_path}")
-                return file_path
-        return None
-    except AttributeError as e:
-        logger.error(f"BeautifulSoup error for {url}: {str(e)}. Possibly invalid HTML or method issue.")
-        return None
+        loop = asyncio.get_running_loop()
+        cleaned_html = await loop.run_in_executor(clean_pool, clean_html, html)
+        file_path = await loop.run_in_executor(
+            io_pool, html_storage.store, urlparse(url).netloc, url, cleaned_html
+        )
+        logger.info(f"Stored HTML: {file_path}")
+        return file_path
     except Exception as e:
         logger.error(f"Failed to save HTML for {url}: {str(e)}")
         return None
 
 
-#### Write to file with context manager
-@contextmanager
-def file_writer(file_path):
-    """Context manager for file writing."""
-    try:
-        file = open(file_path, "w", encoding="utf-8")
-        yield file
-    except (OSError, IOError) as e:
-        logger.error(f"Failed to write to file {file_path}: {str(e)}")
-        yield None
-    finally:
-        if file:
-            file.close()
-
-
 #### Save metadata to Redis
 async def save_metadata(url, file_path, user_agent, browser_type):
-    """Save metadata to Redis."""
+    """Buffer metadata; it is published to Redis in batches by metadata_buffer."""
     try:
         metadata = {
             "url": url,
@@ -333,99 +639,174 @@ async def save_metadata(url, file_path, user_agent, browser_type):
             "user_agent": user_agent or "default",
             "browser_type": browser_type,
         }
-        redis_client.rpush(CONFIG["metadata_crawler"], json.dumps(metadata))
-        logger.debug(f"Metadata saved for {url}: {metadata}")
+        # add() may flush inline, so it runs on an I/O thread
+        await asyncio.get_running_loop().run_in_executor(
+            io_pool, metadata_buffer.add, CONFIG["metadata_crawler"], metadata
+        )
+        logger.debug(f"Metadata buffered for {url}: {metadata}")
         
     except redis.RedisError as e:
         logger.error(f"Failed to save metadata for {url}: {str(e)}")
 
 
-#### Restart browser context (if increased memory issues)
-async def restart_browser_context(browser, page, context, context_settings):
-    """Restart browser context to clear memory."""
+#### Save one crawled page
+async def save_page(url, html, user_agent):
+    """Store the HTML, then buffer its metadata."""
+    file_path = await save_html(url, html)
+    if file_path:
+        await save_metadata(url, file_path, user_agent, CONFIG["browser_type"])
+
+
+#### Crawl one URL on a pooled page
+async def crawl_url(pool, url, domain_limits, saves):
+    """Load one URL on a borrowed page, save its HTML and metadata.
+
+    The save runs as its own task in saves (task -> url) and is shielded: a shutdown that
+    cancels this crawl lets the write finish, and the URL is not returned to the queue.
+    """
+    async with domain_limits[urlparse(url).netloc]:
+        slot, page = await pool.acquire()
+        ok = False # Only navigation / browser failures count against the context
+        try:
+            # load page with retries and exponential backoff
+            logger.info(f"Crawling: {url}")
+            outcome = await load_page_with_retry(page, url, CONFIG["max_retries"], CONFIG["base_wait_time"])
+            fetch_router.record(urlparse(url).hostname, BROWSER, outcome == LOAD_OK)
+            if outcome != LOAD_OK:
+                ok = outcome != LOAD_FAILED
+                logger.error(f"Failed to load {url} after retries ({outcome}). Skipping.")
+                return
+
+            # Get page source
+            try:
+                html = await page.content()
+            except Exception as e:
+                logger.error(f"Failed to get page source for {url}: {str(e)}")
+                return
+            ok = True
+
+            host = urlparse(url).hostname
+            slot.domains.add(host)
+            if storage_states.due(host):
+                await storage_states.save(slot.context, [host])
+        finally:
+            await pool.release(slot, page, ok)
+
+        # Save HTML content and metadata
+        save = asyncio.create_task(save_page(url, html, slot.user_agent))
+        saves[save] = url
+        save.add_done_callback(lambda task: saves.pop(task, None))
+        await asyncio.shield(save)
+
+        # Pause random before this domain slot takes the next URL
+        await asyncio.sleep(random.uniform(*CONFIG["page_pause"]))
+
+
+#### Periodic metadata flush
+async def flush_metadata_periodically():
+    """Publish buffered metadata once it is due, from an I/O thread."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(metadata_buffer.max_delay)
+        await loop.run_in_executor(io_pool, metadata_buffer.flush_if_due)
+        await loop.run_in_executor(io_pool, fetch_router.maybe_sync)
+
+
+#### Fetch URLs from Redis in batches
+async def fetch_urls(count):
+    """Pop up to count URLs in one round trip (LPOP key count)."""
     try:
-        await page.close()
-        await context.close()
-        context = await browser.new_context(**context_settings)
-        page = await context.new_page()
-        await stealth_async(page)
-        logger.info("Restarted browser context")
-        return context, page
-    
-    except Exception as e:
-        logger.error(f"Failed to restart browser context: {str(e)}")
-        raise
+        return await async_redis.lpop(CONFIG["url_pools"], count) or []
+    except redis.RedisError as e:
+        logger.error(f"Failed to pop URLs from Redis: {str(e)}")
+        return []
+
+
+async def return_urls(urls):
+    """Put URLs that were popped but not crawled back at the head of the queue."""
+    if not urls:
+        return
+    try:
+        await async_redis.lpush(CONFIG["url_pools"], *reversed(urls))
+        logger.info(f"Returned {len(urls)} unfinished URLs to {CONFIG['url_pools']}")
+    except redis.RedisError as e:
+        logger.error(f"Failed to return {len(urls)} URLs to Redis: {str(e)}")
+
 
 # Main crawling function
 async def crawl_urls():
-    """Main crawling logic."""
+    """Main crawling logic: keep every pooled page busy with URLs from Redis."""
     try:
         validate_config()
         os.makedirs(CONFIG["storage_folder"], exist_ok=True)
-        urls_processed = 0
+        setup()
 
         async with async_playwright() as playwright:
-            # Initialize browser and context
-            browser, context, page = await initialize_browser(
-                playwright,
-                CONFIG["browser_type"],
-                CONFIG["headless"],
-                CONFIG["browser_args"],
-                CONFIG["context_settings"],
-            )
-            user_agent = get_random_user_agent() # Get random User-Agent for the session
+            pool = PagePool(playwright)
+            domain_limits = defaultdict(lambda: asyncio.Semaphore(CONFIG["domain_concurrency"]))
+            # Enough tasks to fill the pool even while some wait on a busy domain
+            max_tasks = pool.size * 2
+            slots = asyncio.Semaphore(max_tasks)
+            tasks = {}
+            saves = {}
+            queued = deque()
+            lag_monitor = LoopLagMonitor(CONFIG["loop_lag_interval"], CONFIG["loop_lag_report"]).start()
+            flusher = asyncio.create_task(flush_metadata_periodically())
+
+            def task_done(task):
+                tasks.pop(task, None)
+                slots.release()
+                if not task.cancelled() and task.exception():
+                    logger.error(f"Crawl task failed: {task.exception()}")
 
             try:
+                await pool.start()
                 while True:
-                    # Get URL from Redis
-                    url = redis_client.lpop(CONFIG["url_pools"])
-                    if not url:
+                    await slots.acquire()
+                    # Get URLs from Redis, sized to the free task slots
+                    if not queued:
+                        queued.extend(await fetch_urls(min(CONFIG["redis_batch_size"], max_tasks - len(tasks))))
+                    if not queued:
+                        slots.release()
+                        if tasks:
+                            await asyncio.wait(list(tasks))
+                            continue
                         logger.info("No more URLs to crawl.")
                         break
 
-                    # load page with retries and exponential backoff
-                    logger.info(f"Crawling: {url}")
-                    if not await load_page_with_retry(page, url, CONFIG["max_retries"], CONFIG["base_wait_time"]):
-                        logger.error(f"Failed to load {url} after retries. Skipping.")
-                        continue
-                    
-                    # Get page source
-                    try:
-                        html = await page.content()
-                    except Exception as e:
-                        logger.error(f"Failed to get page source for {url}: {str(e)}")
-                        continue
-                    
-                    # Save HTML content and metadata
-                    file_path = await save_html(url, html, CONFIG["storage_folder"])
-                    if file_path:
-                        await save_metadata(url, file_path, user_agent, CONFIG["browser_type"])
-
-                    # Pause every url processed
-                    urls_processed += 1
-
-                    if urls_processed % CONFIG["pause_every"] == 0:
-                        logger.info(f"Processed {urls_processed} URLs, pausing for {CONFIG['pause_duration']} seconds...")
-                        await asyncio.sleep(CONFIG["pause_duration"])
-                    
-                    # Restart browser context if memory issues arise
-                    if urls_processed >= CONFIG["max_urls_before_restart"]:
-                        logger.info("Restarting browser context to clear memory...")
-                        urls_processed = 0
-                        context, page = await restart_browser_context(
-                            browser, page, context, CONFIG["context_settings"]
-                        )
-
-                    # Pause random between requests
-                    logger.info(f"Pausing for a random (2s->4s) duration between requests")
-                    await asyncio.sleep(random.uniform(1, 3))
-                    
+                    url = queued.popleft()
+                    task = asyncio.create_task(crawl_url(pool, url, domain_limits, saves))
+                    tasks[task] = url
+                    task.add_done_callback(task_done)
+
             except Exception as e:
                 logger.error(f"Crawling interrupted: {str(e)}")
             finally:
-                await page.close()
-                await context.close()
-                await browser.close()
+                # URLs already being saved are finished, not returned
+                saving = set(saves.values())
+                unfinished = [url for task, url in tasks.items() if not task.done() and url not in saving]
+                for task in list(tasks):
+                    task.cancel()
+                if tasks:
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                if saves:
+                    await asyncio.gather(*saves, return_exceptions=True)
+                await return_urls(unfinished + list(queued))
+                flusher.cancel()
+                await lag_monitor.stop()
+                logger.info(f"Event loop lag: {lag_monitor.summary()}")
+                await asyncio.get_running_loop().run_in_executor(io_pool, metadata_buffer.flush)
+                logger.info(f"Metadata flush stats: {metadata_buffer.stats}")
+                await asyncio.get_running_loop().run_in_executor(io_pool, fetch_router.sync)
+                logger.info(f"Request routing stats: {dict(route_stats)}")
+                logger.info(f"Page pool stats: {dict(pool.stats)}")
+                html_storage.close()
+                await pool.close()
+                logger.info(f"Storage state stats: {storage_states.stats}")
+                io_pool.shutdown(wait=True)
+                if clean_pool is not io_pool:
+                    clean_pool.shutdown(wait=True)
+                await async_redis.aclose()
                 logger.info("Browser closed successfully.")
 
     except Exception as e:
@@ -433,4 +814,4 @@ async def crawl_urls():
         raise
 
 if __name__ == "__main__":
-    asyncio.run(crawl_urls())
\ No newline at end of file
+    asyncio.run(crawl_urls())
@@ -0,0 +1,263 @@
+"""
+HTML storage backends, selected with HTML_STORAGE_BACKEND.
+
+- FileSystemStorage: one ``<root>/<domain>/<sha256(url)>.html`` file per URL (original layout)
+- PackStorage: append-only pack files per domain with compressed records and an
+  offset index keyed by the URL hash, so writes are sequential appends and
+  readers can memory-map a pack and random-access pages (see PackReader)
+
+Every backend returns a locator string from ``store()``; ``read_html(locator)``
+loads a page back whatever backend wrote it.
+"""
+
+import os
+import gzip
+import mmap
+import socket
+import struct
+import hashlib
+import logging
+import importlib
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Pack record: magic | url hash (32 bytes) | codec (1 byte) | payload length (uint32) | payload
+PACK_MAGIC = b"VSP1"
+RECORD_HEADER = struct.Struct(">4s32sBI")
+# Index entry: url hash (32 bytes) | record offset in pack (uint64)
+INDEX_ENTRY = struct.Struct(">32sQ")
+
+CODEC_NONE, CODEC_GZIP, CODEC_ZSTD = 0, 1, 2
+CODECS = {"none": CODEC_NONE, "gzip": CODEC_GZIP, "zstd": CODEC_ZSTD}
+
+
+def url_key(url):
+    """Raw SHA256 of the URL: the file name / index key for a page."""
+    return hashlib.sha256(url.encode("utf-8")).digest()
+
+
+def load_storage(backend, root, **options):
+    """Instantiate a backend from its dotted path (or 'filesystem' / 'pack')."""
+    aliases = {
+        "filesystem": "vendor_scraper.storage.FileSystemStorage",
+        "pack": "vendor_scraper.storage.PackStorage",
+    }
+    path = aliases.get(backend, backend)
+    module_name, _, class_name = path.rpartition(".")
+    storage_cls = getattr(importlib.import_module(module_name), class_name)
+    return storage_cls(root, **options)
+
+
+class FileSystemStorage:
+    """One uncompressed HTML file per URL under ``<root>/<domain>/``."""
+
+    def __init__(self, root, **options):
+        self.root = root
+        self._known_dirs = set()
+
+    def store(self, domain, url, html):
+        domain_folder = os.path.join(self.root, domain)
+        if domain_folder not in self._known_dirs:
+            os.makedirs(domain_folder, exist_ok=True)
+            self._known_dirs.add(domain_folder)
+
+        file_path = os.path.join(domain_folder, url_key(url).hex() + ".html")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(html)
+        return file_path
+
+    def close(self):
+        pass
+
+
+class _PackWriter:
+    """Open pack + index file pair for one domain."""
+
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        self.pack = open(pack_path, "ab")
+        self.index = open(pack_path[: -len(".pack")] + ".idx", "ab")
+        self.size = self.pack.tell()
+
+    def append(self, key, codec, payload):
+        offset = self.size
+        self.pack.write(RECORD_HEADER.pack(PACK_MAGIC, key, codec, len(payload)))
+        self.pack.write(payload)
+        self.pack.flush()
+        # Index is written after the record so it never points past the pack end
+        self.index.write(INDEX_ENTRY.pack(key, offset))
+        self.index.flush()
+        self.size += RECORD_HEADER.size + len(payload)
+        return offset
+
+    def close(self):
+        self.pack.close()
+        self.index.close()
+
+
+class PackStorage:
+    """Append-only compressed pack files, one writer set per domain and process.
+
+    Pack names include host and pid (``<host>-<pid>-<seq>.pack``) so several
+    workers can write to the same network share without coordination. A pack is
+    rotated once it grows past ``max_pack_mb``.
+    """
+
+    def __init__(self, root, compression="zstd", max_pack_mb=1024, compression_level=None, **options):
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, falling back to gzip pack compression")
+            compression = "gzip"
+        if compression not in CODECS:
+            raise ValueError(f"Invalid pack compression: {compression}. Must be one of {list(CODECS)}.")
+
+        self.root = root
+        self.codec = CODECS[compression]
+        self.max_pack_bytes = int(max_pack_mb * 1024 * 1024)
+        self.prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._writers = {}
+        self._lock = threading.Lock()
+        # ZstdCompressor is not thread-safe and store() is called from I/O thread pools
+        self._local = threading.local()
+        self._zstd_level = compression_level or 3
+        self._gzip_level = compression_level or 6
+
+    def store(self, domain, url, html):
+        payload = self._compress(html.encode("utf-8"))
+        key = url_key(url)
+        with self._lock:
+            writer = self._writer_for(domain, len(payload))
+            offset = writer.append(key, self.codec, payload)
+        return f"{writer.pack_path}#{offset}"
+
+    def close(self):
+        with self._lock:
+            for writer in self._writers.values():
+                writer.close()
+            self._writers.clear()
+
+    def _compress(self, data):
+        if self.codec == CODEC_ZSTD:
+            compressor = getattr(self._local, "zstd", None)
+            if compressor is None:
+                compressor = self._local.zstd = zstandard.ZstdCompressor(level=self._zstd_level)
+            return compressor.compress(data)
+        if self.codec == CODEC_GZIP:
+            return gzip.compress(data, compresslevel=self._gzip_level)
+        return data
+
+    def _writer_for(self, domain, incoming):
+        writer = self._writers.get(domain)
+        if writer and writer.size + incoming <= self.max_pack_bytes:
+            return writer
+        if writer:
+            writer.close()
+
+        domain_folder = os.path.join(self.root, domain)
+        os.makedirs(domain_folder, exist_ok=True)
+        seq = 0
+        while True:
+            pack_path = os.path.join(domain_folder, f"{self.prefix}-{seq:05d}.pack")
+            if not os.path.exists(pack_path) or os.path.getsize(pack_path) + incoming <= self.max_pack_bytes:
+                break
+            seq += 1
+        writer = self._writers[domain] = _PackWriter(pack_path)
+        logger.info(f"Writing HTML pack: {pack_path}")
+        return writer
+
+
+def _decompress(codec, payload):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed packs")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if codec == CODEC_GZIP:
+        return gzip.decompress(payload)
+    return payload
+
+
+class PackReader:
+    """Memory-mapped, random-access reader for one pack file.
+
+    Usage:
+        with PackReader(path) as pack:
+            html = pack.get("https://www.grainger.com/product/...")
+            for key, html in pack: ...
+    """
+
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        self._file = open(pack_path, "rb")
+        # A freshly rotated pack is empty until its first record; empty files cannot be mapped
+        if os.fstat(self._file.fileno()).st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = b""
+        self._offsets = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    @property
+    def offsets(self):
+        """URL hash -> record offset (latest record wins), loaded from the .idx file."""
+        if self._offsets is None:
+            index_path = self.pack_path[: -len(".pack")] + ".idx"
+            if os.path.exists(index_path):
+                with open(index_path, "rb") as f:
+                    data = f.read()
+                usable = len(data) - len(data) % INDEX_ENTRY.size
+                self._offsets = dict(INDEX_ENTRY.iter_unpack(data[:usable]))
+            else:
+                self._offsets = {key: offset for offset, key in self._scan()}
+        return self._offsets
+
+    def read_at(self, offset):
+        if offset + RECORD_HEADER.size > len(self._map):
+            raise ValueError(f"No pack record at {self.pack_path}#{offset}")
+        magic, _, codec, length = RECORD_HEADER.unpack_from(self._map, offset)
+        if magic != PACK_MAGIC:
+            raise ValueError(f"No pack record at {self.pack_path}#{offset}")
+        start = offset + RECORD_HEADER.size
+        return _decompress(codec, self._map[start:start + length]).decode("utf-8")
+
+    def get(self, url=None, key=None):
+        offset = self.offsets.get(key or url_key(url))
+        return None if offset is None else self.read_at(offset)
+
+    def __iter__(self):
+        for offset, key in self._scan():
+            yield key.hex(), self.read_at(offset)
+
+    def _scan(self):
+        """Walk records sequentially (used when the index is missing)."""
+        offset, end = 0, len(self._map)
+        while offset + RECORD_HEADER.size <= end:
+            magic, key, _, length = RECORD_HEADER.unpack_from(self._map, offset)
+            if magic != PACK_MAGIC or offset + RECORD_HEADER.size + length > end:
+                break  # Truncated tail from an interrupted write
+            yield offset, key
+            offset += RECORD_HEADER.size + length
+
+
+def read_html(locator):
+    """Load a stored page from a FileSystemStorage path or a ``<pack>#<offset>`` locator."""
+    path, sep, offset = locator.rpartition("#")
+    if sep and path.endswith(".pack") and offset.isdigit():
+        with PackReader(path) as pack:
+            return pack.read_at(int(offset))
+    with open(locator, "r", encoding="utf-8") as f:
+        return f.read()
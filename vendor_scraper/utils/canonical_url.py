@@ -0,0 +1,104 @@
+"""
+URL canonicalization applied before queueing (add_url_to_pool) and before
+scheduling (CanonicalUrlMiddleware / VendorSpider), so trivial URL variants are
+fetched and fingerprinted once.
+
+Always: lowercase scheme and host, drop default ports and fragments, drop
+tracking parameters and sort the remaining query. Per-domain rules come from the
+optional ``canonical`` block of a site in ``configs/DOM_site.json``. Names such as
+``ref``, ``sid`` or ``sessionid`` are tracking on some sites and select content on
+others, so they are only dropped where a site lists them in ``strip_params``:
+
+    "canonical": {
+        "keep_params": ["id"],            # whitelist; [] drops the whole query
+        "strip_params": ["sort", "ref"],  # extra params to drop
+        "lowercase_path": true,           # path is case-insensitive on this site
+        "strip_trailing_slash": true,     # default true
+        "scheme": "https"                 # force scheme
+    }
+"""
+
+import json
+import logging
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from vendor_scraper.utils.site_config import SiteRegistry, get_registry
+
+TRACKING_PARAMS = frozenset({
+    "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid",
+    "_ga", "_gl", "_hsenc", "_hsmi", "igshid", "ref_", "referrer", "spm",
+    "trk", "cmpid",
+})
+TRACKING_PREFIXES = ("utm_", "pf_rd_", "pd_rd_")
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+
+class UrlCanonicalizer:
+    """Canonicalize URLs with global defaults plus per-domain rules from a SiteRegistry."""
+
+    def __init__(self, registry=None):
+        self.registry = registry
+
+    @classmethod
+    def from_config(cls, path=None):
+        """Rules from DOM_site.json; the shared (hot-reloaded) registry unless a path is given."""
+        try:
+            registry = get_registry() if path is None else SiteRegistry(path, reload_interval=float("inf"))
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not load canonical URL rules from {path or 'DOM_site.json'}: {e}")
+            registry = None
+        return cls(registry)
+
+    def rules_for(self, host):
+        site = self.registry.lookup(host) if self.registry is not None else None
+        return site.canonical if site is not None else {}
+
+    def canonicalize(self, url):
+        try:
+            parts = urlsplit(url.strip())
+            port = parts.port
+        except ValueError:
+            return url
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or "").rstrip(".")
+        if not host:
+            return url
+        rules = self.rules_for(host)
+        scheme = rules.get("scheme", scheme)
+
+        netloc = f"[{host}]" if ":" in host else host
+        if port and str(port) != DEFAULT_PORTS.get(scheme):
+            netloc = f"{netloc}:{port}"
+        if parts.username:
+            auth = parts.username + (f":{parts.password}" if parts.password else "")
+            netloc = f"{auth}@{netloc}"
+
+        path = parts.path or "/"
+        if rules.get("lowercase_path"):
+            path = path.lower()
+        if rules.get("strip_trailing_slash", True) and len(path) > 1:
+            path = path.rstrip("/") or "/"
+
+        keep = rules.get("keep_params")
+        strip = set(rules.get("strip_params", ()))
+        params = [
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if (keep is None or key in keep)
+            and key.lower() not in TRACKING_PARAMS
+            and not key.lower().startswith(TRACKING_PREFIXES)
+            and key not in strip
+        ]
+        query = urlencode(sorted(params))
+
+        return urlunsplit((scheme, netloc, path, query, ""))
+
+
+_default = None
+
+
+def canonicalize_url(url):
+    """Canonicalize with rules from configs/DOM_site.json (shared registry, reloaded on change)."""
+    global _default
+    if _default is None:
+        _default = UrlCanonicalizer.from_config()
+    return _default.canonicalize(url)
@@ -0,0 +1,78 @@
+"""
+Content digest index: remembers, per URL, the digest of the last stored page
+and where it was stored, so unchanged re-crawls can skip the write.
+
+- RedisDigestIndex: one Redis hash shared by all workers (field = sha256(url))
+- LocalDigestIndex: a dbm file on the worker, for single-node crawls
+"""
+
+import dbm
+import hashlib
+import threading
+
+
+def content_digest(html):
+    """Short, fast digest of cleaned page content."""
+    return hashlib.blake2b(html.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _field(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def _decode(value):
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    digest, _, locator = value.partition("|")
+    return digest, locator
+
+
+class RedisDigestIndex:
+    """Digest index stored in a Redis hash."""
+
+    def __init__(self, redis_client, key="scrapy:html_digests"):
+        self.redis_client = redis_client
+        self.key = key
+
+    def get(self, url):
+        """Return (digest, locator) of the last stored version of url, or None."""
+        return _decode(self.redis_client.hget(self.key, _field(url)))
+
+    def set(self, url, digest, locator):
+        self.redis_client.hset(self.key, _field(url), f"{digest}|{locator}")
+
+    def close(self):
+        pass
+
+
+class LocalDigestIndex:
+    """Digest index stored in a local dbm file."""
+
+    def __init__(self, path="html_digests.db"):
+        self._db = dbm.open(path, "c")
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            return _decode(self._db.get(_field(url)))
+
+    def set(self, url, digest, locator):
+        with self._lock:
+            self._db[_field(url)] = f"{digest}|{locator}"
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def load_digest_index(kind, redis_client=None, key="scrapy:html_digests", path="html_digests.db"):
+    """Build the index named by HTML_DIGEST_INDEX ('redis', 'local' or None to disable)."""
+    if not kind:
+        return None
+    if kind == "redis":
+        return RedisDigestIndex(redis_client, key=key)
+    if kind == "local":
+        return LocalDigestIndex(path)
+    raise ValueError(f"Invalid HTML_DIGEST_INDEX: {kind}. Must be 'redis', 'local' or None.")
@@ -0,0 +1,87 @@
+"""
+Per-domain sharded Redis URL queues.
+
+Layout:
+    url_pools:<domain>:start_urls   one Redis list per domain
+    url_pools:domains               Redis set of domains that have a queue (the ring)
+
+Producers push through the URL deduper (``url_dedupe.push_new``); consumers walk the
+ring round-robin with ``DomainRing`` so a huge batch for one vendor cannot starve the others.
+"""
+
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+QUEUE_KEY = "url_pools:{domain}:start_urls"
+DOMAIN_RING_KEY = "url_pools:domains"
+
+
+def domain_of(url):
+    """Queue shard of a URL: its hostname, same as Scrapy's downloader slot key."""
+    try:
+        return urlsplit(url).hostname or ""
+    except ValueError:
+        return ""
+
+
+def domain_queue_key(domain):
+    return QUEUE_KEY.format(domain=domain)
+
+
+class DomainRing:
+    """Round-robin view of the domain ring for one consumer."""
+
+    def __init__(self, redis_client, refresh_interval=30):
+        self.redis_client = redis_client
+        self.refresh_interval = refresh_interval
+        self._domains = []
+        self._cursor = 0
+        self._refreshed_at = 0
+
+    def domains(self):
+        """Active domains, rotated so each call starts one domain further along."""
+        now = time.monotonic()
+        if now - self._refreshed_at >= self.refresh_interval:
+            members = self.redis_client.smembers(DOMAIN_RING_KEY)
+            self._domains = sorted(m.decode() if isinstance(m, bytes) else m for m in members)
+            self._refreshed_at = now
+        if not self._domains:
+            return []
+        self._cursor = (self._cursor + 1) % len(self._domains)
+        return self._domains[self._cursor:] + self._domains[:self._cursor]
+
+    @staticmethod
+    def allocate(domains, budget, capacity):
+        """Deal ``budget`` pops one at a time across domains, never above each domain's capacity."""
+        quotas = defaultdict(int)
+        eligible = [d for d in domains if capacity.get(d, 0) > 0]
+        while budget > 0 and eligible:
+            for domain in list(eligible):
+                if budget <= 0:
+                    break
+                quotas[domain] += 1
+                budget -= 1
+                if quotas[domain] >= capacity[domain]:
+                    eligible.remove(domain)
+        return dict(quotas)
+
+    def pop(self, quotas):
+        """Pop up to quota URLs from each domain list in one pipelined round trip (LPOP count)."""
+        if not quotas:
+            return []
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            for domain, count in quotas.items():
+                pipe.lpop(domain_queue_key(domain), count)
+            results = pipe.execute()
+        return [url for popped in results if popped for url in popped]
+
+    def queued_count(self, extra_keys=()):
+        """Total URLs waiting across all domain lists (plus any legacy keys)."""
+        domains = [m.decode() if isinstance(m, bytes) else m for m in self.redis_client.smembers(DOMAIN_RING_KEY)]
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            for domain in domains:
+                pipe.llen(domain_queue_key(domain))
+            for key in extra_keys:
+                pipe.llen(key)
+            return sum(pipe.execute())
@@ -0,0 +1,188 @@
+"""
+Hybrid fetch routing: plain HTTP (VendorSpider) first, headless browser
+(playwright_worker) only for the domains that need it.
+
+VendorSpider checks each response for the domain's ``SOURCE_PAGE`` selector. A miss
+escalates the URL to the browser queue (the list playwright_worker reads); the
+browser worker reports whether the selector appeared after rendering. Outcomes are
+counted per domain in the Redis hash ``ROUTE_STATS_KEY``:
+
+    <domain>:http_ok  <domain>:http_miss  <domain>:browser_ok  <domain>:browser_miss
+
+Once a domain has ``min_samples`` HTTP outcomes and at least ``escalate_ratio`` of
+them missed, its URLs go straight to the browser queue, except a ``probe_rate``
+share that keeps trying HTTP so the route flips back if the site changes. The
+browser outcomes veto that switch: once the browser has ``min_samples`` outcomes
+for the domain and does not find the selector more often than HTTP does, the
+domain stays on HTTP, since rendering would cost more for nothing. Counts are
+halved past ``window`` samples so old outcomes fade out.
+
+Escalated URLs go to ``browser_queue`` (``FETCH_ROUTER_BROWSER_QUEUE``), or to the
+domain's own list in ``browser_queues`` (``FETCH_ROUTER_BROWSER_QUEUES``) so separate
+playwright_worker processes can serve separate domains.
+
+A ``"fetch": "http"`` or ``"fetch": "browser"`` entry in DOM_site.json pins a
+domain's route; the default is ``"auto"``.
+"""
+
+import time
+import random
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from urllib.parse import urlsplit
+
+import redis
+
+ROUTE_STATS_KEY = "route:domains"
+BROWSER_QUEUE_KEY = "browser:start_urls"  # Default list read by playwright_worker
+
+HTTP = "http"
+BROWSER = "browser"
+
+logger = logging.getLogger(__name__)
+
+
+class FetchRouter:
+    """Per-domain HTTP / browser route learned from selector hits, shared via Redis."""
+
+    def __init__(
+        self,
+        redis_client,
+        browser_queue=BROWSER_QUEUE_KEY,
+        stats_key=ROUTE_STATS_KEY,
+        browser_queues=None,
+        min_samples=20,
+        escalate_ratio=0.8,
+        probe_rate=0.05,
+        window=1000,
+        sync_interval=30,
+    ):
+        self.redis_client = redis_client
+        self.browser_queue = browser_queue
+        self.browser_queues = browser_queues or {}  # domain -> list, overrides browser_queue
+        self.stats_key = stats_key
+        self.min_samples = min_samples
+        self.escalate_ratio = escalate_ratio
+        self.probe_rate = probe_rate
+        self.window = window
+        self.sync_interval = sync_interval
+        self.shared = Counter()  # Last counts read from Redis (plus our unsynced ones)
+        self.pending = Counter()  # Outcomes not yet written to Redis
+        # record() runs on the crawl thread / event loop, sync() on an I/O thread
+        self._lock = threading.Lock()
+        self._synced_at = 0
+
+    @classmethod
+    def from_settings(cls, settings, redis_client):
+        return cls(
+            redis_client,
+            browser_queue=settings.get("FETCH_ROUTER_BROWSER_QUEUE", BROWSER_QUEUE_KEY),
+            stats_key=settings.get("FETCH_ROUTER_REDIS_KEY", ROUTE_STATS_KEY),
+            browser_queues=settings.getdict("FETCH_ROUTER_BROWSER_QUEUES"),
+            min_samples=settings.getint("FETCH_ROUTER_MIN_SAMPLES", 20),
+            escalate_ratio=settings.getfloat("FETCH_ROUTER_ESCALATE_RATIO", 0.8),
+            probe_rate=settings.getfloat("FETCH_ROUTER_PROBE_RATE", 0.05),
+            sync_interval=settings.getfloat("FETCH_ROUTER_SYNC_INTERVAL", 30),
+        )
+
+    # ---- decisions ----
+    def route(self, domain, site=None):
+        """HTTP or BROWSER for the next URL of this domain."""
+        if site is not None and site.fetch in (HTTP, BROWSER):
+            return site.fetch
+        self.maybe_sync()
+        shared = self.shared
+        http_ok, http_miss = shared[f"{domain}:http_ok"], shared[f"{domain}:http_miss"]
+        http_total = http_ok + http_miss
+        if http_total < self.min_samples or http_miss < self.escalate_ratio * http_total:
+            return HTTP
+        browser_ok, browser_miss = shared[f"{domain}:browser_ok"], shared[f"{domain}:browser_miss"]
+        browser_total = browser_ok + browser_miss
+        if browser_total >= self.min_samples and browser_ok / browser_total <= http_ok / http_total:
+            return HTTP  # Rendering does not find the selector more often: not worth it
+        return HTTP if random.random() < self.probe_rate else BROWSER
+
+    def record(self, domain, path, ok):
+        field = f"{domain}:{path}_{'ok' if ok else 'miss'}"
+        with self._lock:
+            self.pending[field] += 1
+            self.shared[field] += 1
+
+    def queue_for(self, domain):
+        return self.browser_queues.get(domain, self.browser_queue)
+
+    def escalate(self, urls):
+        """Queue URLs for playwright_worker; returns how many were pushed."""
+        by_queue = defaultdict(list)
+        for url in urls:
+            by_queue[self.queue_for(urlsplit(url).hostname or "")].append(url)
+        if not by_queue:
+            return 0
+        try:
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                for queue, queue_urls in by_queue.items():
+                    pipe.lpush(queue, *queue_urls)
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Failed to escalate URLs to {', '.join(by_queue)}: {e}")
+            return 0
+        return sum(len(queue_urls) for queue_urls in by_queue.values())
+
+    # ---- shared state ----
+    def maybe_sync(self):
+        if time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """Write our outcomes with HINCRBY and read everyone's counts back in one round trip."""
+        self._synced_at = time.monotonic()
+        with self._lock:
+            pending, self.pending = self.pending, Counter()
+        try:
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                for field, count in pending.items():
+                    pipe.hincrby(self.stats_key, field, count)
+                pipe.hgetall(self.stats_key)
+                remote = pipe.execute()[-1]
+        except redis.RedisError as e:
+            logger.warning(f"Fetch route sync failed: {e}")
+            with self._lock:
+                self.pending.update(pending)
+            return
+        counts = Counter()
+        for field, value in remote.items():
+            field = field.decode() if isinstance(field, bytes) else field
+            counts[field] = int(value)
+        with self._lock:
+            # Outcomes recorded while the round trip was in flight are not in remote yet
+            counts.update(self.pending)
+            self.shared = counts
+        self._decay(counts)
+
+    def _decay(self, counts):
+        # Halve a domain/path pair once it passes the window (approximate under
+        # concurrent writers, which is fine for a ratio)
+        halved = {}
+        for prefix in {field.rpartition("_")[0] for field in counts}:
+            ok_field, miss_field = f"{prefix}_ok", f"{prefix}_miss"
+            if counts[ok_field] + counts[miss_field] > self.window:
+                halved[ok_field] = counts[ok_field] // 2
+                halved[miss_field] = counts[miss_field] // 2
+        if halved:
+            try:
+                self.redis_client.hset(self.stats_key, mapping=halved)
+                with self._lock:
+                    for field, value in halved.items():
+                        self.shared[field] = value
+            except redis.RedisError as e:
+                logger.warning(f"Fetch route decay failed: {e}")
+
+    def summary(self):
+        """{domain: {"http_ok": n, ...}} from the last sync."""
+        domains = {}
+        for field, value in self.shared.items():
+            domain, _, outcome = field.rpartition(":")
+            domains.setdefault(domain, {})[outcome] = value
+        return domains
@@ -0,0 +1,181 @@
+"""
+Declarative field extraction rules from ``configs/DOM_site.json``.
+
+A site may declare ``"fields"``; each rule is compiled once (CSS translated to XPath,
+then to an ``lxml.etree.XPath`` object) and evaluated on a page's lxml root, so the
+same rules serve ``VendorSpider.parse`` and batch re-parsing in ``dataflow/parse``::
+
+    "fields": {
+        "DESCRIPTION": "div[data-testid=pdp-header] h1",
+        "SHORT_DESC": {"css": "meta[name=description]::attr(content)"},
+        "IMAGES": {"css": "img.product::attr(src)", "multiple": true},
+        "SPECIFICATIONS": {"css": "div.specs tr", "pairs": {"key": "th", "value": "td"}},
+        "SPEC_TABLE": {"xpath": "//table//tr", "pairs": {"key": {"xpath": "td[1]"}, "value": {"xpath": "td[2]"}},
+                       "flatten": true, "key_case": "upper", "columns": ["BRAND"]}
+    }
+
+- A string rule is a CSS selector; otherwise ``css`` or ``xpath``.
+- Default: text of the first match. ``multiple``: list of every match.
+  ``pairs``: one key/value per match, with ``key``/``value`` selectors relative to it
+  (a repeated key keeps its last value; after ``key_case``, the first of the keys
+  that only differ in case).
+- Values go through ``clean_text`` unless ``"clean": false``.
+- ``when`` (a selector) leaves the field out of the record on pages where it matches
+  nothing, instead of setting an empty value.
+- ``flatten`` merges a pairs rule into the record. Named fields always win; between
+  flattened rules the earlier one wins unless the later one sets ``"override": true``.
+  ``key_case`` (``upper``/``lower``) normalizes its keys and ``columns`` lists the
+  keys expected for CSV output.
+
+A rule that fails on a page (for example a ``pairs`` rule whose rows select
+attributes or strings) yields an empty value; the error is logged once per rule.
+"""
+
+import re
+import logging
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+_translator = HTMLTranslator()
+
+_INVISIBLE = re.compile(r"[\u200e\u200f]")
+_MARKS = re.compile(r"[\u00AE\u2122]")
+_SPACES = re.compile(r"\s+")
+
+_string = etree.XPath("string()")
+
+
+def clean_text(text):
+    """Strip invisible marks, ® / ™, collapsed whitespace and stray colons."""
+    if not text:
+        return ""
+    text = _INVISIBLE.sub("", text)  # Left-to-right / right-to-left marks (common on Amazon)
+    text = _MARKS.sub("", text)
+    text = _SPACES.sub(" ", text)
+    return text.strip(" :\n\t").strip()
+
+
+def selector_xpath(spec):
+    """XPath of a selector spec: a CSS string, or {"css": ...} / {"xpath": ...}."""
+    if isinstance(spec, str):
+        return _translator.css_to_xpath(spec)
+    if "xpath" in spec:
+        return spec["xpath"]
+    return _translator.css_to_xpath(spec["css"])
+
+
+def _first_text(xpath):
+    return etree.XPath(f"string(({xpath})[1])", smart_strings=False)
+
+
+class FieldRule:
+    """One compiled field; raises on an invalid selector or rule."""
+
+    def __init__(self, name, spec, domain=""):
+        self.name = name
+        self.domain = domain
+        if isinstance(spec, str):
+            spec = {"css": spec}
+        self.spec = spec
+        self.clean = clean_text if spec.get("clean", True) else (lambda value: value)
+        self.flatten = spec.get("flatten", False)
+        self.override = spec.get("override", False)
+        self.key_case = spec.get("key_case")
+        self.columns = spec.get("columns", [])
+        xpath = selector_xpath(spec)
+        if "pairs" in spec:
+            self.kind = "pairs"
+            self.rows = etree.XPath(xpath, smart_strings=False)
+            self.key = _first_text(selector_xpath(spec["pairs"]["key"]))
+            self.value = _first_text(selector_xpath(spec["pairs"]["value"]))
+        elif spec.get("multiple"):
+            self.kind = "multiple"
+            self.nodes = etree.XPath(xpath, smart_strings=False)
+        else:
+            self.kind = "first"
+            self.first = _first_text(xpath)
+        if self.flatten and self.kind != "pairs":
+            raise ValueError("flatten needs a pairs rule")
+        if self.key_case not in (None, "upper", "lower"):
+            raise ValueError(f"key_case must be 'upper' or 'lower', not {self.key_case!r}")
+        if self.override and not self.flatten:
+            raise ValueError("override needs a flatten rule")
+        self.when = None
+        if "when" in spec:
+            self.when = etree.XPath(f"boolean({selector_xpath(spec['when'])})")
+        self._failed = False
+
+    def empty(self):
+        return {"first": "", "multiple": [], "pairs": {}}[self.kind]
+
+    def extract(self, root):
+        """Value of the rule on a page; None when its "when" selector does not match."""
+        try:
+            if self.when is not None and not self.when(root):
+                return None
+            return self._extract(root)
+        except Exception as e:
+            if not self._failed:
+                self._failed = True
+                logging.error(f"Field rule {self.name} failed for {self.domain or 'page'}: {e!r}")
+            return self.empty()
+
+    def _extract(self, root):
+        if self.kind == "first":
+            return self.clean(self.first(root))
+        if self.kind == "multiple":
+            values = (node if isinstance(node, str) else _string(node) for node in self.nodes(root))
+            return [value for value in map(self.clean, values) if value]
+        pairs = {}
+        for row in self.rows(root):
+            key = self.clean(self.key(row))
+            if key:
+                pairs[key] = self.clean(self.value(row))
+        if self.key_case is None:
+            return pairs
+        # Keys that only differ in case: the first one keeps its value
+        normalized = {}
+        for key, value in pairs.items():
+            normalized.setdefault(key.upper() if self.key_case == "upper" else key.lower(), value)
+        return normalized
+
+
+def compile_fields(fields, domain=""):
+    """Compile a site's "fields" block; invalid rules are logged and skipped."""
+    rules = []
+    for name, spec in fields.items():
+        try:
+            rules.append(FieldRule(name, spec, domain))
+        except Exception as e:
+            logging.error(f"Invalid field rule {name}={spec!r} for {domain}: {e}")
+    return rules
+
+
+def extract_fields(root, rules):
+    """Apply compiled rules to a page (lxml root or parsel Selector); returns a flat dict."""
+    root = getattr(root, "root", root)
+    record = {}
+    named = {rule.name for rule in rules if not rule.flatten}
+    for rule in rules:
+        value = rule.extract(root)
+        if value is None:
+            continue
+        if rule.flatten:
+            for key, pair_value in value.items():
+                if rule.override and key not in named:
+                    record[key] = pair_value
+                else:
+                    record.setdefault(key, pair_value)
+        else:
+            record[rule.name] = value
+    return record
+
+
+def field_columns(rules):
+    """Output column order of the rules (flattened rules contribute their declared columns)."""
+    columns = []
+    for rule in rules:
+        for column in (rule.columns if rule.flatten else [rule.name]):
+            if column not in columns:
+                columns.append(column)
+    return columns
@@ -0,0 +1,174 @@
+"""
+Header profiles: consistent browser header bundles (User-Agent + Accept +
+Accept-Language + sec-ch-ua client hints) shared by the User-Agent and browser
+header middlewares and the Playwright worker.
+
+Profiles are read from a local JSON cache. Without a cache they are built from
+``configs/list_user_agents.txt``, so a worker never waits on the network at boot.
+When the cache is older than the TTL and a fetcher is configured (ScrapeOps
+browser headers), a background thread refreshes it; the old profiles stay in use
+until the new ones are written.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import logging
+import threading
+
+USER_AGENTS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "configs", "list_user_agents.txt")
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "vendor_scraper", "header_profiles.json")
+
+logger = logging.getLogger(__name__)
+
+CHROMIUM_ACCEPT = (
+    "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,"
+    "image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7"
+)
+FIREFOX_ACCEPT = "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8"
+SAFARI_ACCEPT = "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"
+
+# Brand in sec-ch-ua for Chromium-based browsers (first match wins)
+CHROMIUM_BRANDS = (
+    ("Edg/", "Microsoft Edge"),
+    ("OPR/", "Opera"),
+    ("SamsungBrowser/", "Samsung Internet"),
+    ("; wv)", "Android WebView"),
+    ("Chrome/", "Google Chrome"),
+)
+
+
+def _platform(user_agent):
+    if "Android" in user_agent:
+        return "Android"
+    if "iPhone" in user_agent or "iPad" in user_agent:
+        return "iOS"
+    if "Windows" in user_agent:
+        return "Windows"
+    if "Macintosh" in user_agent:
+        return "macOS"
+    if "CrOS" in user_agent:
+        return "Chrome OS"
+    return "Linux"
+
+
+def build_profile(user_agent):
+    """Header bundle a real browser with this User-Agent would send."""
+    headers = {
+        "User-Agent": user_agent,
+        "Accept-Language": "en-US,en;q=0.9",
+        "Upgrade-Insecure-Requests": "1",
+    }
+    chrome = re.search(r"Chrome/(\d+)", user_agent)
+    if "Firefox/" in user_agent:
+        headers["Accept"] = FIREFOX_ACCEPT
+        headers["Accept-Language"] = "en-US,en;q=0.5"
+    elif chrome and "Electron/" not in user_agent:
+        version = chrome.group(1)
+        brand = next(name for token, name in CHROMIUM_BRANDS if token in user_agent)
+        mobile = "Mobile" in user_agent
+        headers["Accept"] = CHROMIUM_ACCEPT
+        headers["sec-ch-ua"] = f'"Chromium";v="{version}", "{brand}";v="{version}", "Not-A.Brand";v="99"'
+        headers["sec-ch-ua-mobile"] = "?1" if mobile else "?0"
+        headers["sec-ch-ua-platform"] = f'"{_platform(user_agent)}"'
+        headers["Sec-Fetch-Site"] = "none"
+        headers["Sec-Fetch-Mode"] = "navigate"
+        headers["Sec-Fetch-User"] = "?1"
+        headers["Sec-Fetch-Dest"] = "document"
+    else:
+        headers["Accept"] = SAFARI_ACCEPT if "Safari/" in user_agent else CHROMIUM_ACCEPT
+    return headers
+
+
+def load_user_agents(path=USER_AGENTS_PATH):
+    """User-Agents from list_user_agents.txt (one per line, optionally quoted with a trailing comma)."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = (line.strip().rstrip(",").strip().strip('"') for line in f)
+        return [line for line in lines if line.startswith("Mozilla/")]
+
+
+class HeaderProfileProvider:
+    """Random header profiles from a local cache, refreshed in the background after ``ttl`` seconds."""
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, seed_path=USER_AGENTS_PATH, ttl=86400, fetcher=None):
+        self.cache_path = cache_path
+        self.seed_path = seed_path
+        self.ttl = ttl
+        self.fetcher = fetcher
+        self.profiles = []
+        self.fetched_at = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+            self.profiles = cache["profiles"]
+            self.fetched_at = cache.get("fetched_at", 0)
+            logger.info(f"Loaded {len(self.profiles)} header profiles from {self.cache_path}")
+        except (OSError, ValueError, KeyError):
+            self.profiles = []
+        if not self.profiles:
+            # Seed: fetched_at stays 0 so a configured fetcher refreshes right away
+            self.profiles = [build_profile(ua) for ua in load_user_agents(self.seed_path)]
+            self.fetched_at = 0
+            logger.info(f"Seeded {len(self.profiles)} header profiles from {self.seed_path}")
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": self.fetched_at, "profiles": self.profiles}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _maybe_refresh(self):
+        if self.fetcher is None or self._refreshing or time.time() - self.fetched_at < self.ttl:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="header-profiles", daemon=True).start()
+
+    def _refresh(self):
+        try:
+            profiles = [p for p in self.fetcher() if p.get("User-Agent") or p.get("user-agent")]
+            if profiles:
+                self.profiles = profiles
+                self.fetched_at = time.time()
+                self._save()
+                logger.info(f"Refreshed {len(profiles)} header profiles")
+            else:
+                logger.warning("Header profile refresh returned nothing, keeping cached profiles")
+        except Exception as e:
+            logger.warning(f"Header profile refresh failed, keeping cached profiles: {e}")
+        finally:
+            # After a failure, retry in an hour (or one TTL if that is shorter)
+            self.fetched_at = max(self.fetched_at, time.time() - self.ttl + min(self.ttl, 3600))
+            self._refreshing = False
+
+    def random_profile(self):
+        self._maybe_refresh()
+        return dict(random.choice(self.profiles))
+
+    def random_user_agent(self):
+        profile = self.random_profile()
+        return profile.get("User-Agent") or profile.get("user-agent")
+
+
+_providers = {}
+
+
+def get_provider(cache_path=DEFAULT_CACHE_PATH, ttl=86400, fetcher=None):
+    """One provider per cache file and process (shared by the middlewares)."""
+    cache_path = cache_path or DEFAULT_CACHE_PATH
+    provider = _providers.get(cache_path)
+    if provider is None:
+        provider = _providers[cache_path] = HeaderProfileProvider(cache_path, ttl=ttl, fetcher=fetcher)
+    elif fetcher is not None and provider.fetcher is None:
+        provider.fetcher = fetcher
+    return provider
@@ -0,0 +1,91 @@
+"""
+HTML cleaning stage shared by ProductItem and the storage pipelines.
+
+A single tokenizer pass (stdlib ``html.parser``) that drops the subtrees of
+unwanted tags (script, video, iframe) and collapses whitespace, instead of
+building a full BeautifulSoup tree and prettifying it.
+"""
+
+from html.parser import HTMLParser
+
+DROP_TAGS = frozenset({"script", "video", "iframe"})
+
+
+class _StreamingCleaner(HTMLParser):
+    """Re-emit the raw markup token by token, skipping dropped subtrees."""
+
+    def __init__(self, drop_tags):
+        # Keep entities as written so the output is byte-for-byte the source markup
+        super().__init__(convert_charrefs=False)
+        self.drop_tags = drop_tags
+        self.parts = []
+        self._skip_tag = None
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_depth:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if tag in self.drop_tags:
+            self._skip_tag = tag
+            self._skip_depth = 1
+            return
+        self.parts.append(self.get_starttag_text())
+
+    def handle_startendtag(self, tag, attrs):
+        if self._skip_depth or tag in self.drop_tags:
+            return
+        self.parts.append(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if self._skip_depth:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+            return
+        if tag in self.drop_tags:
+            return
+        self.parts.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+    def handle_entityref(self, name):
+        if not self._skip_depth:
+            self.parts.append(f"&{name};")
+
+    def handle_charref(self, name):
+        if not self._skip_depth:
+            self.parts.append(f"&#{name};")
+
+    def handle_comment(self, data):
+        if not self._skip_depth:
+            self.parts.append(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self.parts.append(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        if not self._skip_depth:
+            self.parts.append(f"<?{data}>")
+
+    def unknown_decl(self, data):
+        if not self._skip_depth:
+            self.parts.append(f"<![{data}]>")
+
+
+def clean_html(html, drop_tags=DROP_TAGS):
+    """Drop script/video/iframe subtrees and normalize whitespace in one pass."""
+    if not html:
+        return ""
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    try:
+        parser = _StreamingCleaner(drop_tags)
+        parser.feed(html)
+        parser.close()
+        cleaned = "".join(parser.parts)
+    except Exception:
+        cleaned = html
+    return " ".join(cleaned.split())
@@ -0,0 +1,67 @@
+"""
+Event-loop lag monitor for asyncio workers.
+
+A background task sleeps ``interval`` seconds and records how late it wakes up.
+Any blocking call on the loop thread (sync Redis, file writes, HTML parsing)
+shows up directly as lag, so the numbers prove whether the loop is stalled.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """Measure event-loop lag and log a summary every ``report_interval`` seconds."""
+
+    def __init__(self, interval=0.5, report_interval=30, slow_ms=100):
+        self.interval = interval
+        self.report_interval = report_interval
+        self.slow_ms = slow_ms
+        self.stats = {"samples": 0, "slow": 0, "max_ms": 0.0, "total_ms": 0.0}
+        self._window_max = 0.0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_report = loop.time()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            self.record((now - start - self.interval) * 1000)
+            if now - last_report >= self.report_interval:
+                last_report = now
+                logger.info(f"Event loop lag: max {self._window_max:.1f} ms (last {self.report_interval}s), {self.summary()}")
+                self._window_max = 0.0
+
+    def record(self, lag_ms):
+        lag_ms = max(0.0, lag_ms)
+        self.stats["samples"] += 1
+        self.stats["total_ms"] += lag_ms
+        self.stats["max_ms"] = max(self.stats["max_ms"], lag_ms)
+        self._window_max = max(self._window_max, lag_ms)
+        if lag_ms >= self.slow_ms:
+            self.stats["slow"] += 1
+
+    def summary(self):
+        samples = self.stats["samples"]
+        avg = self.stats["total_ms"] / samples if samples else 0.0
+        return (
+            f"avg {avg:.1f} ms, max {self.stats['max_ms']:.1f} ms, "
+            f"{self.stats['slow']}/{samples} samples >= {self.slow_ms} ms"
+        )
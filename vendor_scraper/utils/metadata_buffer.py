@@ -0,0 +1,110 @@
+"""
+In-process buffer for crawl metadata records.
+
+Records are queued per Redis key and published with a single pipelined RPUSH
+per key once ``max_records`` are buffered or the oldest record is older than
+``max_delay_ms``. Owners call ``flush_if_due()`` periodically and ``flush()``
+on shutdown.
+"""
+
+import json
+import time
+import redis
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataBuffer:
+    """Thread-safe, size/age-bounded buffer of metadata records."""
+
+    def __init__(self, redis_client, max_records=500, max_delay_ms=1000):
+        self.redis_client = redis_client
+        self.max_records = max(1, max_records)
+        self.max_delay = max_delay_ms / 1000
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._records = defaultdict(list)
+        self._count = 0
+        self._oldest = None
+        self.stats = {
+            "flushes": 0,
+            "records_flushed": 0,
+            "last_flush_size": 0,
+            "max_flush_size": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+            "flush_errors": 0,
+        }
+
+    def __len__(self):
+        return self._count
+
+    def add(self, key, record):
+        """Queue one record for ``key``; flushes inline when the buffer is due."""
+        payload = json.dumps(record)
+        with self._lock:
+            self._records[key].append(payload)
+            self._count += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = self._is_due()
+        if due:
+            self.flush()
+
+    def flush_if_due(self):
+        with self._lock:
+            due = self._is_due()
+        return self.flush() if due else 0
+
+    def flush(self):
+        """Publish everything buffered. Returns the number of records sent."""
+        with self._flush_lock:
+            with self._lock:
+                batch, size = self._records, self._count
+                self._records, self._count, self._oldest = defaultdict(list), 0, None
+            if not size:
+                return 0
+
+            start = time.monotonic()
+            try:
+                with self.redis_client.pipeline(transaction=False) as pipe:
+                    for key, payloads in batch.items():
+                        pipe.rpush(key, *payloads)
+                    pipe.execute()
+            except redis.RedisError as e:
+                logger.error(f"Failed to flush {size} metadata records: {e}")
+                self.stats["flush_errors"] += 1
+                self._requeue(batch, size)
+                return 0
+
+            elapsed_ms = (time.monotonic() - start) * 1000
+            self.stats["flushes"] += 1
+            self.stats["records_flushed"] += size
+            self.stats["last_flush_size"] = size
+            self.stats["max_flush_size"] = max(self.stats["max_flush_size"], size)
+            self.stats["last_flush_ms"] = elapsed_ms
+            self.stats["max_flush_ms"] = max(self.stats["max_flush_ms"], elapsed_ms)
+            self.stats["total_flush_ms"] += elapsed_ms
+            logger.debug(f"Flushed {size} metadata records in {elapsed_ms:.1f} ms")
+            return size
+
+    def _is_due(self):
+        if not self._count:
+            return False
+        return (
+            self._count >= self.max_records
+            or time.monotonic() - self._oldest >= self.max_delay
+        )
+
+    def _requeue(self, batch, size):
+        """Put a failed batch back in front of anything buffered since."""
+        with self._lock:
+            for key, payloads in self._records.items():
+                batch[key].extend(payloads)
+            self._records = batch
+            self._count += size
+            self._oldest = time.monotonic()
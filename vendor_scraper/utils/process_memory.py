@@ -0,0 +1,104 @@
+"""
+Resident memory of this process's child process tree (the Playwright driver and
+the browsers it launched).
+
+Processes started by ``multiprocessing`` (a ``ProcessPoolExecutor``'s workers, the
+resource tracker) are not browser memory: their subtrees are left out of the sum.
+
+Uses psutil when it is installed and falls back to ``/proc`` on Linux. The sum
+counts memory shared between Chromium processes more than once, so treat it as an
+upper bound and size limits accordingly. Returns None where neither is available.
+"""
+
+import os
+import logging
+import multiprocessing
+from multiprocessing import resource_tracker
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def helper_pids():
+    """PIDs of this process's multiprocessing children and its resource tracker."""
+    pids = {process.pid for process in multiprocessing.active_children()}
+    tracker = getattr(resource_tracker, "_resource_tracker", None)
+    if getattr(tracker, "_pid", None):
+        pids.add(tracker._pid)
+    return pids
+
+
+def _children_proc(root_pid, exclude):
+    """Descendant PIDs of root_pid from /proc/<pid>/stat, without the subtrees in exclude."""
+    parents = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # comm may contain spaces/parens: fields after the last ")" are fixed
+        fields = stat[stat.rfind(b")") + 2:].split()
+        parents.setdefault(int(fields[1]), []).append(int(name))
+    pids, stack = [], [root_pid]
+    while stack:
+        children = [pid for pid in parents.get(stack.pop(), []) if pid not in exclude]
+        pids.extend(children)
+        stack.extend(children)
+    return pids
+
+
+def _rss_proc(pid):
+    try:
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _children_psutil(root_pid, exclude):
+    children, stack = [], [psutil.Process(root_pid)]
+    while stack:
+        try:
+            found = stack.pop().children()
+        except psutil.Error:
+            continue  # Exited while we were looking
+        for child in found:
+            if child.pid not in exclude:
+                children.append(child)
+                stack.append(child)
+    return children
+
+
+def children_rss_mb(root_pid=None, exclude=None):
+    """Summed RSS in MB of the descendants of root_pid (default: this process).
+
+    Subtrees rooted at a PID in exclude are skipped; by default that is helper_pids()
+    when root_pid is this process.
+    """
+    root_pid = root_pid or os.getpid()
+    if exclude is None:
+        exclude = helper_pids() if root_pid == os.getpid() else set()
+    if psutil is not None:
+        total = 0
+        try:
+            children = _children_psutil(root_pid, exclude)
+        except psutil.Error:
+            return None
+        for child in children:
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                continue  # Exited while we were looking
+        return total / 2 ** 20
+    if os.path.isdir("/proc"):
+        return sum(_rss_proc(pid) for pid in _children_proc(root_pid, exclude)) / 2 ** 20
+    return None
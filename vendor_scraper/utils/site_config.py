@@ -0,0 +1,155 @@
+"""
+Compiled registry of the vendor configs in ``configs/DOM_site.json``.
+
+- Sites are indexed by host with ``www.`` stripped; a lookup walks up the host's
+  parent domains, so ``www.grainger.com`` and ``shop.grainger.com`` both resolve
+  to a ``grainger.com`` entry (and ``grainger.com`` to a ``www.grainger.com`` one).
+- CSS selectors are translated to XPath once per load instead of per response,
+  and ``fields`` rules are compiled to lxml XPath objects (see ``field_rules.py``).
+- The file is located relative to the package, not the working directory.
+- The file's mtime is checked at most every ``reload_interval`` seconds and the
+  registry is rebuilt in place when it changes; a broken edit keeps the last good
+  config.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+from parsel.csstranslator import HTMLTranslator
+from vendor_scraper.utils.field_rules import compile_fields, extract_fields, field_columns
+
+DOM_SITE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "configs", "DOM_site.json")
+
+_translator = HTMLTranslator()
+
+
+def normalize_host(host):
+    """Lowercase hostname without port, trailing dot or leading ``www.``."""
+    if "//" in host:
+        host = urlsplit(host).hostname or ""
+    host = host.split(":", 1)[0].strip().rstrip(".").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def host_candidates(host):
+    """Host, then each parent domain: a.b.example.com -> b.example.com -> example.com."""
+    labels = normalize_host(host).split(".")
+    for i in range(len(labels) - 1):
+        yield ".".join(labels[i:])
+
+
+class SiteConfig:
+    """One vendor entry of DOM_site.json with its selectors precompiled to XPath."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.domain = raw["domain"]
+        self.selectors = raw.get("selectors", {})
+        self.canonical = raw.get("canonical", {})
+        self.crawl = raw.get("crawl", {})
+        self.fetch = raw.get("fetch", "auto")
+        self.xpaths = {}
+        for name, css in self.selectors.items():
+            try:
+                self.xpaths[name] = _translator.css_to_xpath(css)
+            except Exception as e:
+                logging.error(f"Invalid selector {name}={css!r} for {self.domain}: {e}")
+        self.fields = compile_fields(raw.get("fields", {}), self.domain)
+        self.field_columns = field_columns(self.fields)
+
+    def xpath(self, name):
+        return self.xpaths.get(name)
+
+    def extract(self, page):
+        """Field values of a page (parsel Selector / Response or lxml root) per the "fields" rules."""
+        return extract_fields(getattr(page, "selector", page), self.fields)
+
+    def __repr__(self):
+        return f"<SiteConfig {self.domain}>"
+
+
+class SiteRegistry:
+    """Host -> SiteConfig index over DOM_site.json, hot-reloaded when the file changes."""
+
+    def __init__(self, path=DOM_SITE_PATH, reload_interval=5):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.version = 0
+        self.sites = []
+        self._index = {}
+        self._cache = {}
+        self._mtime = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Read and compile the file; raises OSError / JSONDecodeError on the first load."""
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        sites = [SiteConfig(raw) for raw in data.get("website", [])]
+        index = {}
+        for site in sites:
+            index.setdefault(normalize_host(site.domain), site)
+        with self._lock:
+            self.sites = sites
+            self._index = index
+            self._cache = {}
+            self._mtime = mtime
+            self.version += 1
+        logging.info(f"Loaded {len(sites)} site configs from {self.path}")
+
+    def maybe_reload(self):
+        """Reload if the file changed since the last load (checked at most every reload_interval)."""
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return False
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            self.load()
+            return True
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Could not reload {self.path}, keeping previous config: {e}")
+            self._mtime = mtime  # Retry only after the next edit
+            return False
+
+    def lookup(self, host):
+        """SiteConfig for a host or URL, or None if no configured domain covers it."""
+        self.maybe_reload()
+        cache = self._cache
+        if host in cache:
+            return cache[host]
+        site = None
+        for candidate in host_candidates(host):
+            site = self._index.get(candidate)
+            if site is not None:
+                break
+        cache[host] = site
+        return site
+
+    def __len__(self):
+        return len(self.sites)
+
+    def __iter__(self):
+        return iter(self.sites)
+
+
+_registry = None
+
+
+def get_registry():
+    """Process-wide registry for configs/DOM_site.json (created on first use)."""
+    global _registry
+    if _registry is None:
+        _registry = SiteRegistry()
+    return _registry
@@ -0,0 +1,113 @@
+"""
+Per-domain browser storage state (cookies + localStorage) shared through Redis.
+
+After a successful page load the worker snapshots its context's storage state and
+keeps only what belongs to that domain: cookies whose domain is the host or one of
+its subdomains/parents, and localStorage of matching origins. Snapshots are stored
+in the Redis hash ``key`` (field = domain, value = JSON), so every worker and every
+new context starts with the consent choices and challenge cookies already earned.
+
+A new context merges all snapshots younger than ``ttl`` into one Playwright
+``storage_state``; expired cookies are dropped on the way in and out.
+"""
+
+import json
+import time
+import logging
+from urllib.parse import urlsplit
+
+import redis
+
+from vendor_scraper.utils.site_config import normalize_host
+
+STORAGE_STATE_KEY = "browser:storage_state"
+
+logger = logging.getLogger(__name__)
+
+
+def _matches(host, base):
+    host = normalize_host(host.lstrip("."))
+    return host == base or host.endswith(f".{base}") or base.endswith(f".{host}")
+
+
+def filter_state(state, domain, now=None):
+    """Cookies and origins of a Playwright storage_state that belong to domain."""
+    now = now or time.time()
+    base = normalize_host(domain)
+    cookies = [
+        c for c in state.get("cookies", [])
+        if _matches(c.get("domain", ""), base) and (c.get("expires", -1) in (-1, None) or c["expires"] > now)
+    ]
+    origins = [
+        o for o in state.get("origins", [])
+        if _matches(urlsplit(o.get("origin", "")).hostname or "", base) and o.get("localStorage")
+    ]
+    return {"cookies": cookies, "origins": origins}
+
+
+class StorageStateStore:
+    """Load / save per-domain storage state with an asyncio Redis client."""
+
+    def __init__(self, redis_client, key=STORAGE_STATE_KEY, ttl=86400, save_interval=300):
+        self.redis_client = redis_client
+        self.key = key
+        self.ttl = ttl
+        self.save_interval = save_interval
+        self.saved_at = {}  # domain -> last save by this worker (monotonic)
+        self.stats = {"loaded_domains": 0, "saved": 0, "errors": 0}
+
+    def due(self, domain):
+        return time.monotonic() - self.saved_at.get(domain, float("-inf")) >= self.save_interval
+
+    async def load(self):
+        """Merged storage_state of every fresh domain snapshot, or None if there is none."""
+        try:
+            raw = await self.redis_client.hgetall(self.key)
+        except redis.RedisError as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Failed to load browser storage state: {e}")
+            return None
+        now = time.time()
+        cookies, origins, domains = [], [], 0
+        for domain, value in raw.items():
+            try:
+                snapshot = json.loads(value)
+            except ValueError:
+                continue
+            if now - snapshot.get("updated", 0) > self.ttl:
+                continue
+            state = filter_state(snapshot, domain, now)
+            cookies += state["cookies"]
+            origins += state["origins"]
+            domains += 1
+        self.stats["loaded_domains"] = domains
+        if not cookies and not origins:
+            return None
+        return {"cookies": cookies, "origins": origins}
+
+    async def save(self, context, domains):
+        """Snapshot the context once and store each domain's share of it."""
+        domains = set(domains)
+        if not domains:
+            return
+        try:
+            state = await context.storage_state()
+        except Exception as e:
+            logger.warning(f"Failed to read browser storage state: {e}")
+            return
+        now = time.time()
+        updates = {}
+        for domain in domains:
+            snapshot = filter_state(state, domain, now)
+            if snapshot["cookies"] or snapshot["origins"]:
+                snapshot["updated"] = now
+                updates[domain] = json.dumps(snapshot)
+            self.saved_at[domain] = time.monotonic()
+        if not updates:
+            return
+        try:
+            await self.redis_client.hset(self.key, mapping=updates)
+            self.stats["saved"] += len(updates)
+        except redis.RedisError as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Failed to save browser storage state: {e}")